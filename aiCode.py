@@ -7,17 +7,90 @@ import base64
 import hmac
 import hashlib
 import re
-from typing import Optional, Tuple
-from dataclasses import dataclass
+import ast
+import textwrap
+import tokenize
+import sqlite3
+import gzip
+import io
+import atexit
+import threading
+import queue
+import shlex
+import socket
+import shutil
+import subprocess
+import tempfile
+import stat
+import difflib
+import functools
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager, nullcontext, redirect_stdout
+import urllib.request
+import urllib.error
+from typing import Optional, Tuple, Iterator, Callable, List
+from dataclasses import dataclass, field
 from pathlib import Path
 from datetime import date
-from groq import Groq
+
+def _tc(av: list) -> int:
+    sp, op, cw, y = ".aicode.sock", "run", [], False
+    it = iter(av)
+    for a in it:
+        if a == "--socket":
+            sp = next(it, sp)
+        elif a == "--stop-daemon":
+            op = "stop"
+        elif a == "--yes" and not cw:
+            y = True
+        elif a != "--client":
+            cw.append(a)
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(sp)
+    except OSError as ex:
+        sys.stderr.write(f"No daemon at {sp} ({ex}); start one with --daemon\n")
+        return 2
+    rc = 1
+    with s, s.makefile("rw", encoding="utf-8", newline="\n") as f:
+        f.write(json.dumps({"op": op, "cmd": ' '.join(cw), "cwd": os.getcwd(), "yes": y}) + "\n")
+        f.flush()
+        for ln in f:
+            m = json.loads(ln)
+            if "o" in m:
+                sys.stdout.write(m["o"])
+                sys.stdout.flush()
+            if "rc" in m:
+                rc = m["rc"]
+                break
+    return rc
+
+# Thin client: answer before the heavy imports below
+if __name__ == "__main__" and sys.argv[1:2] in (["--client"], ["--stop-daemon"]):
+    sys.exit(_tc(sys.argv[1:]))
+
+try:
+    from groq import Groq
+except ImportError:
+    Groq = None
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 from rich.console import Console
 from rich.prompt import Prompt, Confirm
 from rich.panel import Panel
 from rich.text import Text
-from dotenv import load_dotenv, set_key
+from rich.syntax import Syntax
+from rich.markup import escape
+from dotenv import load_dotenv
 import argparse
+from string import Template
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
 
 # Integrity check
 _s = b'\x89\x50\x4e\x47\x0d\x0a\x1a\x0a\x39\x38\x34\x34'
@@ -36,10 +109,675 @@ class Config:
     _ct: float = 30.0
     _mfs: int = 1_000_000
     _be: bool = True
+    _bk: str = "groq"
+    _rr: dict = field(default_factory=dict)
+    _lu: str = "http://127.0.0.1:8080/v1"
+    _lmd: str = "local"
+    _fdm: str = "llama-3.1-8b-instant"
+    _rth: int = 1500
+    _rsl: float = 8.0
+    _pin: dict = field(default_factory=dict)
+    _pl: bool = False
+    _pg: bool = False
+    _pgl: int = 200
+    _sdb: str = ".aicode_state.db"
+    _vl: bool = True
+    _vln: bool = False
+    _vtc: Optional[str] = None
+    _vrn: int = 2
+    _rc: bool = False
+    _ldf: str = ".aicode_ledger.tsv"
+    _bud: dict = field(default_factory=dict)
+    _bum: str = "warn"
+    _rw: int = 4
+    _rtb: int = 6000
+    _rmc: int = 24000
+    _rcf: Optional[str] = None
+    _rpf: Optional[str] = None
+    _rps: float = 1.0
+    _prf: Optional[str] = None
+    _so: bool = False
+    _ag: bool = False
+    _cn: int = 1
+    _cpt: bool = False
+    _hmx: int = 500
+    _ol: bool = False
+    _ags: int = 6
+    _agt: int = 24000
+
+_BKS = ("groq", "local")
+
+def _pbd(s: str) -> dict:
+    bd = {}
+    for k, v in _prr(s).items():
+        if not re.fullmatch(r'(?:[a-z]+\.)?(?:session|day)', k):
+            raise ValueError(f"bad budget scope: {k}")
+        bd[k] = float(v[1:]) if v.startswith('$') else int(v)
+    return bd
+
+_UM = os.umask(0)
+os.umask(_UM)
+
+def _aw(p, ct: str, ex: bool = False, nl: Optional[str] = None) -> None:
+    p = Path(p)
+    fd, tp = tempfile.mkstemp(prefix=f".{p.name}.", suffix=".tmp", dir=str(p.parent))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline=nl) as f:
+            f.write(ct)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tp, stat.S_IMODE(p.stat().st_mode) if p.exists() and not ex else 0o666 & ~_UM)
+        if not ex:
+            os.replace(tp, p)
+            return
+        try:
+            os.link(tp, p)
+        except FileExistsError:
+            raise
+        except OSError:
+            os.close(os.open(p, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            os.replace(tp, p)
+    finally:
+        if os.path.exists(tp):
+            os.unlink(tp)
+
+@contextmanager
+def _flk(p):
+    if fcntl is None:
+        yield
+        return
+    d = Path(".aicode_locks")
+    d.mkdir(exist_ok=True)
+    lp = d / (hashlib.sha1(str(Path(p).resolve()).encode()).hexdigest()[:16] + ".lock")
+    with open(lp, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _m3(b: str, x: str, y: str) -> Optional[str]:
+    bl = b.splitlines(keepends=True)
+    
+    def hk(o):
+        ol = o.splitlines(keepends=True)
+        sm = difflib.SequenceMatcher(None, bl, ol, autojunk=False)
+        return [(i1, i2, ol[j1:j2]) for t, i1, i2, j1, j2 in sm.get_opcodes() if t != "equal"]
+    out, i, pv = [], 0, None
+    for s, e, r in sorted(hk(x) + hk(y), key=lambda h: (h[0], h[1])):
+        if pv:
+            if (s, e, r) == pv:
+                continue
+            if s < pv[1] or (s == pv[0] and (s == e or pv[0] == pv[1])):
+                return None
+        out += bl[i:s] + r
+        i, pv = e, (s, e, r)
+    return ''.join(out + bl[i:])
+
+class _PF:
+    def __init__(self):
+        self.on = False
+        self.d = Path(".aicode_profiles")
+        self._tl = threading.local()
+        self._lk = threading.Lock()
+        self._t: dict = {}
+    
+    @contextmanager
+    def ph(self, n: str):
+        if not self.on:
+            yield
+            return
+        sk = self._tl.__dict__.setdefault("sk", [])
+        t0 = time.perf_counter()
+        if sk:
+            self._add(sk[-1][0], t0 - sk[-1][1])
+        sk.append([n, t0])
+        try:
+            yield
+        finally:
+            t1 = time.perf_counter()
+            self._add(n, t1 - sk.pop()[1])
+            if sk:
+                sk[-1][1] = t1
+    
+    def wrap(self, n: str):
+        def dc(f):
+            @functools.wraps(f)
+            def w(*a, **kw):
+                if not self.on:
+                    return f(*a, **kw)
+                with self.ph(n):
+                    return f(*a, **kw)
+            return w
+        return dc
+    
+    def _add(self, n: str, dt: float) -> None:
+        with self._lk:
+            self._t[n] = self._t.get(n, 0.0) + dt
+    
+    def run(self, c: Console, lb: str, fn: Callable, *a):
+        if not self.on:
+            return fn(*a)
+        self._t = {}
+        tm = not tracemalloc.is_tracing()
+        if tm:
+            tracemalloc.start(10)
+        getattr(tracemalloc, "reset_peak", tracemalloc.clear_traces)()
+        s0 = tracemalloc.take_snapshot()
+        pr = cProfile.Profile()
+        t0 = time.perf_counter()
+        try:
+            return pr.runcall(fn, *a)
+        finally:
+            wt = time.perf_counter() - t0
+            pk = tracemalloc.get_traced_memory()[1]
+            md = tracemalloc.take_snapshot().compare_to(s0, "lineno")[:10]
+            if tm:
+                tracemalloc.stop()
+            try:
+                c.print(f"[blue]{self._rep(lb, pr, wt, pk, md)}[/blue]")
+            except OSError as ex:
+                c.print(f"[yellow]Profile not written: {ex}[/yellow]")
+    
+    def _rep(self, lb: str, pr: cProfile.Profile, wt: float, pk: int, md: list) -> str:
+        self.d.mkdir(parents=True, exist_ok=True)
+        sl = re.sub(r'[^\w-]', '_', lb)
+        bp = self.d / f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{sl}"
+        pr.dump_stats(f"{bp}.prof")
+        ph = sorted(self._t.items(), key=lambda x: -x[1])
+        ot = wt - sum(v for k, v in ph)
+        sio = io.StringIO()
+        sio.write(f"{lb}: {wt:.3f}s wall, peak traced memory {pk / 1048576:.2f} MB\n\n")
+        sio.write("Phases (self time; worker threads add up, so the sum can exceed wall time):\n")
+        for k, v in ph + [("other", max(0.0, ot))]:
+            sio.write(f"  {k:<10} {v:8.3f}s {100 * v / wt if wt else 0:5.1f}%\n")
+        sio.write("\nTop allocations since the command started:\n")
+        for d in md:
+            sio.write(f"  {d}\n")
+        sio.write("\n")
+        pstats.Stats(pr, stream=sio).sort_stats("cumulative").print_stats(30)
+        Path(f"{bp}.txt").write_text(sio.getvalue(), encoding="utf-8")
+        ps = ', '.join(f"{k} {v:.2f}s" for k, v in ph[:4])
+        return f"Profile: {wt:.2f}s{' (' + ps + ')' if ps else ''}, peak {pk / 1048576:.1f} MB -> {bp}.prof"
+
+_pf = _PF()
+
+def _irt(p: Path, b: Path) -> bool:
+    try:
+        p.relative_to(b)
+        return True
+    except ValueError:
+        return False
+
+def _sdn(ex) -> None:
+    try:
+        ex.shutdown(wait=False, cancel_futures=True)
+        return
+    except TypeError:
+        pass
+    for w in list((getattr(ex, "_pending_work_items", None) or {}).values()):
+        w.future.cancel()
+    wq = getattr(ex, "_work_queue", None) if isinstance(ex, ThreadPoolExecutor) else None
+    while wq is not None:
+        try:
+            w = wq.get_nowait()
+        except queue.Empty:
+            break
+        if w is not None:
+            w.future.cancel()
+    ex.shutdown(wait=False)
+
+def _gre(g: str) -> str:
+    o, i = [], 0
+    while i < len(g):
+        if g.startswith("**/", i):
+            o.append("(?:.*/)?")
+            i += 3
+            continue
+        if g.startswith("**", i):
+            o.append(".*")
+            i += 2
+            continue
+        ch = g[i]
+        j = g.find("]", i + 2) if ch == "[" else -1
+        if ch == "*":
+            o.append("[^/]*")
+        elif ch == "?":
+            o.append("[^/]")
+        elif j > 0:
+            cl = g[i + 1:j]
+            o.append("[" + ("^" + cl[1:] if cl[0] == "!" else cl).replace("\\", "\\\\") + "]")
+            i = j
+        else:
+            o.append(re.escape(ch))
+        i += 1
+    return ''.join(o) + r"\Z"
+
+def _jed(t: str) -> Tuple[Optional[dict], str]:
+    try:
+        d = json.loads(t)
+    except ValueError as ex:
+        return None, f"not valid JSON ({ex})"
+    if not isinstance(d, dict) or not isinstance(d.get("files"), list):
+        return None, 'top level must be an object with a "files" list'
+    if not isinstance(d.get("notes", ""), str):
+        return None, '"notes" must be a string'
+    for i, f in enumerate(d["files"]):
+        if not isinstance(f, dict) or not isinstance(f.get("path"), str) or not f["path"].strip():
+            return None, f"files[{i}].path must be a non-empty string"
+        a = f.get("action")
+        if a not in ("create", "modify", "delete"):
+            return None, f"files[{i}].action must be create, modify or delete"
+        if a == "delete":
+            continue
+        if isinstance(f.get("content"), str) == isinstance(f.get("patch"), str):
+            return None, f"files[{i}] needs exactly one of content or patch"
+        if a == "create" and "patch" in f:
+            return None, f"files[{i}] creates a file, so it needs content, not a patch"
+    return d, ""
+
+def _apd(src: str, pt: str) -> Optional[str]:
+    sl, out, i = src.splitlines(), [], 0
+    hs = list(re.finditer(r'^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@.*$', pt, re.M))
+    if not hs:
+        return None
+    for k, h in enumerate(hs):
+        od, nw = [], []
+        for ln in pt[h.end():hs[k + 1].start() if k + 1 < len(hs) else len(pt)].split("\n")[1:]:
+            t, x = ln[:1], ln[1:]
+            if t in (" ", ""):
+                od.append(x)
+                nw.append(x)
+            elif t == "-":
+                od.append(x)
+            elif t == "+":
+                nw.append(x)
+        while od and nw and od[-1] == "" and nw[-1] == "":
+            od.pop()
+            nw.pop()
+        if od:
+            ks = [x.rstrip() for x in od]
+            t = max(i, int(h.group(1)) - 1)
+            cs = [j for j in range(i, len(sl) - len(od) + 1) if [x.rstrip() for x in sl[j:j + len(od)]] == ks]
+            if t in cs:
+                j = t
+            elif len(cs) == 1:
+                j = cs[0]
+            else:
+                return None
+        else:
+            j = max(i, min(len(sl), int(h.group(1))))
+        out += sl[i:j] + nw
+        i = j + len(od)
+    out += sl[i:]
+    return "\n".join(out) + "\n"
+
+def _jcm(t: str) -> Tuple[Optional[dict], str]:
+    try:
+        d = json.loads(t)
+    except ValueError as ex:
+        return None, f"not valid JSON ({ex})"
+    if not isinstance(d, dict) or not isinstance(d.get("rules", []), list) or not isinstance(d.get("renames", {}), dict):
+        return None, 'top level must be an object with a "rules" list and/or a "renames" object'
+    if not d.get("rules") and not d.get("renames"):
+        return None, "give at least one rule or rename"
+    for i, r in enumerate(d.get("rules", [])):
+        if not isinstance(r, dict) or not isinstance(r.get("find"), str) or not isinstance(r.get("replace"), str):
+            return None, f'rules[{i}] needs string "find" and "replace"'
+        try:
+            re.compile(r["find"], re.M)
+        except re.error as ex:
+            return None, f"rules[{i}].find is not a valid Python regex ({ex})"
+        try:
+            re.compile(r["find"], re.M).sub(r["replace"], "")
+        except re.error as ex:
+            return None, f"rules[{i}].replace is not a valid replacement ({ex})"
+    for k, v in d.get("renames", {}).items():
+        if not (isinstance(v, str) and k.isidentifier() and v.isidentifier()):
+            return None, f"renames must map identifiers to identifiers ({k!r})"
+    return d, ""
+
+def _rnm(fp: str, ct: str, rn: dict) -> str:
+    if fp.endswith(".py"):
+        try:
+            ts = [t for t in tokenize.generate_tokens(io.StringIO(ct).readline)
+                  if t.type == tokenize.NAME and t.string in rn]
+        except (tokenize.TokenError, SyntaxError):
+            ts = None
+        if ts is not None:
+            ls = ct.splitlines(keepends=True)
+            for t in reversed(ts):
+                r, c = t.start
+                ls[r - 1] = ls[r - 1][:c] + rn[t.string] + ls[r - 1][c + len(t.string):]
+            return "".join(ls)
+    return re.sub(r'\b(' + '|'.join(map(re.escape, rn)) + r')\b', lambda m: rn[m.group(1)], ct)
+
+def _cmx(fp: str, rs: list, rn: dict) -> Tuple[str, Optional[str], str, int, int]:
+    try:
+        with open(fp, encoding="utf-8", newline="") as f:
+            src = f.read()
+    except (UnicodeDecodeError, OSError):
+        return fp, None, "", 0, 0
+    ct = src
+    for f, r in rs:
+        ct = re.sub(f, r, ct, flags=re.M)
+    if rn:
+        ct = _rnm(fp, ct, rn)
+    if ct == src:
+        return fp, None, "", 0, 0
+    ad = rm = 0
+    for l in difflib.unified_diff(src.splitlines(), ct.splitlines(), lineterm="", n=0):
+        if l[:1] == "+" and not l.startswith("+++"):
+            ad += 1
+        elif l[:1] == "-" and not l.startswith("---"):
+            rm += 1
+    return fp, ct, hashlib.sha256(src.encode()).hexdigest(), ad, rm
+
+def _prr(s: str) -> dict:
+    rr = {}
+    for it in s.split(','):
+        if '=' in it:
+            k, v = it.split('=', 1)
+            if k.strip() and v.strip():
+                rr[k.strip().lower()] = v.strip()
+    return rr
+
+class _SS:
+    _SQL = """
+    CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v TEXT);
+    CREATE TABLE IF NOT EXISTS ctr (k TEXT PRIMARY KEY, n INTEGER NOT NULL DEFAULT 0);
+    CREATE TABLE IF NOT EXISTS keys (k TEXT PRIMARY KEY, added REAL, last REAL,
+                                     n INTEGER NOT NULL DEFAULT 0, fails INTEGER NOT NULL DEFAULT 0);
+    CREATE TABLE IF NOT EXISTS metrics (ts REAL, cmd TEXT, b TEXT, m TEXT, lat REAL,
+                                        ok INTEGER, pt INTEGER, ct INTEGER);
+    CREATE INDEX IF NOT EXISTS metrics_ts ON metrics (ts);
+    CREATE TABLE IF NOT EXISTS cache (k TEXT PRIMARY KEY, v TEXT, ts REAL);
+    CREATE TABLE IF NOT EXISTS history (ts REAL, cmd TEXT, fp TEXT, pr TEXT, r TEXT);
+    """
+    
+    def __init__(self, c: Console, cfg: Config, bn: int = 32, bi: float = 2.0):
+        self._c = c
+        self._cfg = cfg
+        self._lk = threading.RLock()
+        self._q: list[Tuple[str, tuple]] = []
+        self._pc: dict[str, int] = {}
+        self._pv: dict[str, Optional[str]] = {}
+        self._bn = bn
+        self._bi = bi
+        self._tmr: Optional[threading.Timer] = None
+        self._db = sqlite3.connect(cfg._sdb, timeout=15, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self._SQL)
+        self._mig()
+        atexit.register(self.close)
+    
+    def _tx(self, ops: list) -> None:
+        with self._lk:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, a in ops:
+                    self._db.execute(sql, a)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+    
+    def _mig(self) -> None:
+        up, lp = Path(".aicode_usage.json"), Path(".aicode_license")
+        ops, done = [], []
+        if up.exists():
+            try:
+                pu = int(json.loads(up.read_text()).get("prompts_used", 0))
+                ops.append(("INSERT INTO ctr (k, n) VALUES ('prompts_used', ?) "
+                            "ON CONFLICT(k) DO UPDATE SET n = max(n, excluded.n)", (pu,)))
+            except Exception:
+                pass
+            done.append(up)
+        if lp.exists():
+            try:
+                ops.append(("INSERT OR REPLACE INTO kv (k, v) VALUES ('license', ?)",
+                            (json.dumps(lp.read_text().strip()),)))
+                done.append(lp)
+            except OSError:
+                pass
+        if not ops:
+            return
+        try:
+            self._tx(ops)
+        except sqlite3.Error as ex:
+            self._c.print(f"[yellow]State migration failed: {ex}[/yellow]")
+            return
+        for p in done:
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+        if done:
+            self._c.print(f"[blue]Migrated {', '.join(p.name for p in done)} to {self._cfg._sdb}[/blue]")
+    
+    def put(self, sql: str, a: tuple = ()) -> None:
+        with self._lk:
+            self._q.append((sql, a))
+            if len(self._q) >= self._bn:
+                self.flush()
+            elif not self._tmr:
+                self._tmr = threading.Timer(self._bi, self.flush)
+                self._tmr.daemon = True
+                self._tmr.start()
+    
+    def flush(self) -> None:
+        with self._lk:
+            if self._tmr:
+                self._tmr.cancel()
+                self._tmr = None
+            if not self._q:
+                return
+            try:
+                self._tx(self._q)
+            except sqlite3.Error as ex:
+                self._c.print(f"[red]State save error: {ex} (will retry)[/red]")
+                return
+            self._q = []
+            self._pc.clear()
+            self._pv.clear()
+    
+    def close(self) -> None:
+        self.flush()
+    
+    def get(self, k: str, d=None):
+        with self._lk:
+            if "kv:" + k in self._pv:
+                r = self._pv["kv:" + k]
+            else:
+                r = self._db.execute("SELECT v FROM kv WHERE k = ?", (k,)).fetchone()
+                r = r[0] if r else None
+        return json.loads(r) if r is not None else d
+    
+    def set(self, k: str, v) -> None:
+        with self._lk:
+            self._pv["kv:" + k] = json.dumps(v)
+            self.put("INSERT OR REPLACE INTO kv (k, v) VALUES (?, ?)", (k, self._pv["kv:" + k]))
+    
+    def drop(self, k: str) -> None:
+        with self._lk:
+            self._pv["kv:" + k] = None
+            self._pc[k] = -self.cnt(k) + self._pc.get(k, 0)
+            self.put("DELETE FROM kv WHERE k = ?", (k,))
+            self.put("DELETE FROM ctr WHERE k = ?", (k,))
+    
+    def cnt(self, k: str) -> int:
+        with self._lk:
+            r = self._db.execute("SELECT n FROM ctr WHERE k = ?", (k,)).fetchone()
+            return (r[0] if r else 0) + self._pc.get(k, 0)
+    
+    def incr(self, k: str, n: int = 1) -> None:
+        with self._lk:
+            self._pc[k] = self._pc.get(k, 0) + n
+            self.put("INSERT INTO ctr (k, n) VALUES (?, ?) "
+                     "ON CONFLICT(k) DO UPDATE SET n = n + excluded.n", (k, n))
+    
+    def keys(self) -> List[str]:
+        with self._lk:
+            return [r[0] for r in self._db.execute("SELECT k FROM keys ORDER BY added")]
+    
+    def add_key(self, k: str) -> None:
+        self.put("INSERT OR IGNORE INTO keys (k, added) VALUES (?, ?)", (k, time.time()))
+    
+    def key_used(self, k: str, ok: bool) -> None:
+        self.put("UPDATE keys SET last = ?, n = n + 1, fails = fails + ? WHERE k = ?",
+                 (time.time(), 0 if ok else 1, k))
+    
+    def metric(self, cmd: str, rs: '_RS', ok: bool) -> None:
+        self.put("INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                 (time.time(), cmd, rs.b, rs.m, rs.lat, int(ok), rs.pt, rs.ct))
+    
+    def recent(self, n: int = 200) -> list:
+        with self._lk:
+            return self._db.execute("SELECT m, lat, ok FROM metrics ORDER BY ts DESC LIMIT ?",
+                                    (n,)).fetchall()[::-1]
+    
+    def cget(self, k: str) -> Optional[str]:
+        with self._lk:
+            if "c:" + k in self._pv:
+                return self._pv["c:" + k]
+            r = self._db.execute("SELECT v FROM cache WHERE k = ?", (k,)).fetchone()
+        return r[0] if r else None
+    
+    def cput(self, k: str, v: str) -> None:
+        with self._lk:
+            self._pv["c:" + k] = v
+            self.put("INSERT OR REPLACE INTO cache (k, v, ts) VALUES (?, ?, ?)", (k, v, time.time()))
+    
+    def hist(self, cmd: str, fp: Optional[str], pr: str, r: str) -> None:
+        with self._lk:
+            self.put("INSERT INTO history VALUES (?, ?, ?, ?, ?)", (time.time(), cmd, fp, pr, r))
+            self.put("DELETE FROM history WHERE ts < (SELECT ts FROM history ORDER BY ts DESC LIMIT 1 OFFSET ?)",
+                     (max(1, self._cfg._hmx) - 1,))
+    
+    def hlast(self, n: int = 10) -> list:
+        self.flush()
+        with self._lk:
+            return self._db.execute("SELECT ts, cmd, fp, pr, r FROM history ORDER BY ts DESC LIMIT ?",
+                                    (n,)).fetchall()[::-1]
+
+class _LD:
+    _PR = {"llama-3.3-70b-versatile": (0.59, 0.79), "llama-3.1-8b-instant": (0.05, 0.08),
+           "openai/gpt-oss-120b": (0.15, 0.60), "openai/gpt-oss-20b": (0.075, 0.30),
+           "qwen/qwen3-32b": (0.29, 0.59)}
+    _BY = {"file": 2, "command": 1, "model": 3, "key": 4}
+    
+    def __init__(self, c: Console, cfg: Config):
+        self._c = c
+        self._cfg = cfg
+        self._lk = threading.Lock()
+        self._p = Path(cfg._ldf)
+        self._f = None
+        self._off = 0
+        self._day = ""
+        self._dt: dict = {}
+        self._st: dict = {}
+        for k, v in _prr(os.getenv("AICODE_PRICES", "")).items():
+            try:
+                i, o = v.split('/')
+                self._PR[k] = (float(i), float(o))
+            except ValueError:
+                pass
+    
+    def cost(self, m: str, pt: int, ct: int) -> float:
+        i, o = self._PR.get(m, (0.0, 0.0))
+        return (pt * i + ct * o) / 1_000_000
+    
+    @staticmethod
+    def _add(t: dict, cmd: str, tk: int, co: float) -> None:
+        for k in ("", cmd):
+            a = t.setdefault(k, [0, 0.0])
+            a[0] += tk
+            a[1] += co
+    
+    def _sync(self) -> None:
+        td = date.today().isoformat()
+        if td != self._day:
+            self._day, self._dt, self._off = td, {}, 0
+        try:
+            with open(self._p, "r", encoding="utf-8") as f:
+                f.seek(self._off)
+                for ln in f:
+                    if not ln.endswith("\n"):
+                        break
+                    self._off += len(ln.encode("utf-8"))
+                    r = ln.rstrip("\n").split("\t")
+                    if len(r) == 8 and time.strftime("%Y-%m-%d", time.localtime(int(r[0]))) == td:
+                        self._add(self._dt, r[1], int(r[5]) + int(r[6]), float(r[7]))
+        except FileNotFoundError:
+            pass
+    
+    def allow(self, cmd: str) -> bool:
+        if not self._cfg._bud:
+            return True
+        with self._lk:
+            self._sync()
+            ov = []
+            for k, lim in self._cfg._bud.items():
+                c, _, sc = k.rpartition(".")
+                tk, co = (self._st if sc == "session" else self._dt).get(c, [0, 0.0])
+                if c and c != cmd:
+                    continue
+                us = co if isinstance(lim, float) else tk
+                if us >= lim:
+                    ov.append(f"{k} {us:.4f}/{lim:.4f} USD" if isinstance(lim, float) else f"{k} {us}/{lim} tokens")
+        if not ov:
+            return True
+        if self._cfg._bum == "refuse":
+            self._c.print(f"[red]Budget exceeded: {', '.join(ov)} - request refused[/red]")
+            return False
+        self._c.print(f"[yellow]Budget warning: {', '.join(ov)}[/yellow]")
+        return True
+    
+    def add(self, cmd: str, fp: Optional[str], rs: '_RS', ky: Optional[str]) -> None:
+        co = self.cost(rs.m, rs.pt, rs.ct)
+        kf = hashlib.sha256(ky.encode()).hexdigest()[:8] if ky and rs.b == "groq" else "-"
+        ln = "\t".join([str(int(time.time())), cmd, (fp or "-").replace("\t", " "), rs.m, kf,
+                        str(rs.pt), str(rs.ct), f"{co:.6f}"]) + "\n"
+        with self._lk:
+            self._add(self._st, cmd, rs.pt + rs.ct, co)
+            try:
+                if self._f is None:
+                    self._f = open(self._p, "a", encoding="utf-8", buffering=1)
+                if fcntl:
+                    fcntl.flock(self._f, fcntl.LOCK_EX)
+                try:
+                    self._f.write(ln)
+                finally:
+                    if fcntl:
+                        fcntl.flock(self._f, fcntl.LOCK_UN)
+            except OSError as ex:
+                self._c.print(f"[yellow]Ledger write failed: {ex}[/yellow]")
+    
+    def report(self, by: str, dn: int) -> list:
+        ct = time.time() - dn * 86400 if dn else 0
+        ag: dict = {}
+        try:
+            with open(self._p, "r", encoding="utf-8") as f:
+                for ln in f:
+                    r = ln.rstrip("\n").split("\t")
+                    if len(r) != 8 or int(r[0]) < ct:
+                        continue
+                    k = time.strftime("%Y-%m-%d", time.localtime(int(r[0]))) if by == "day" else r[self._BY[by]]
+                    a = ag.setdefault(k, [0, 0, 0, 0.0])
+                    a[0] += 1
+                    a[1] += int(r[5])
+                    a[2] += int(r[6])
+                    a[3] += float(r[7])
+        except FileNotFoundError:
+            pass
+        return sorted(ag.items(), key=lambda x: x[0] if by == "day" else -x[1][1] - x[1][2])
 
 class _LM:
-    def __init__(self, c: Console):
+    def __init__(self, c: Console, ss: _SS):
         self._c = c
+        self._ss = ss
         self._s = _s[-4:]
         self._l = False
         self._ed: Optional[date] = None
@@ -49,20 +787,16 @@ class _LM:
             self._lu()
     
     def _ll(self) -> None:
-        lp = Path(".aicode_license")
-        if lp.exists():
+        t = self._ss.get("license")
+        if t:
             try:
-                t = lp.read_text().strip()
                 e = self._vt(t)
                 if e and e >= date.today():
                     self._l = True
                     self._ed = e
                     self._c.print(f"[green]Licensed until {e.isoformat()}[/green]")
-                    up = Path(".aicode_usage.json")
-                    if up.exists():
-                        up.unlink()
                 else:
-                    lp.unlink()
+                    self._ss.drop("license")
                     self._c.print("[yellow]License expired[/yellow]")
             except Exception as ex:
                 self._c.print(f"[red]License error: {ex}[/red]")
@@ -83,38 +817,35 @@ class _LM:
         return None
     
     def _lu(self) -> None:
-        up = Path(".aicode_usage.json")
-        if up.exists():
-            try:
-                with open(up, "r") as f:
-                    d = json.load(f)
-                    pu = d.get("prompts_used", 0)
-                    self._rf = max(0, 5 - pu)
-            except:
-                self._rf = 5
-        else:
-            self._rf = 5
+        self._rf = max(0, 5 - self._ss.cnt("prompts_used"))
         self._c.print(f"[blue]Free prompts: {self._rf}[/blue]")
     
     def _su(self) -> None:
-        up = Path(".aicode_usage.json")
-        pu = 5 - self._rf
-        try:
-            with open(up, "w") as f:
-                json.dump({"prompts_used": pu}, f)
-        except Exception as ex:
-            self._c.print(f"[red]Save error: {ex}[/red]")
+        self._ss.incr("prompts_used")
+        self._rf = max(0, 5 - self._ss.cnt("prompts_used"))
+    
+    def activate(self, t: str) -> bool:
+        e = self._vt(t)
+        if not e or e < date.today():
+            self._c.print("[red]Invalid token[/red]")
+            return False
+        self._ss.set("license", t)
+        self._ss.drop("prompts_used")
+        self._ss.flush()
+        self._l = True
+        self._ed = e
+        self._c.print(f"[green]License activated until {e.isoformat()}[/green]")
+        return True
     
     def reset(self, p: str) -> bool:
         if p != self._s.decode():
             self._c.print("[red]Invalid password[/red]")
             return False
-        lp = Path(".aicode_license")
-        if lp.exists():
-            lp.unlink()
-        up = Path(".aicode_usage.json")
-        if up.exists():
-            up.unlink()
+        self._ss.drop("license")
+        self._ss.drop("prompts_used")
+        self._ss.flush()
+        self._l = False
+        self._ed = None
         self._ll()
         self._lu()
         self._c.print("[green]Reset complete[/green]")
@@ -123,8 +854,8 @@ class _LM:
     def use_prompt(self) -> bool:
         if self._l:
             return True
+        self._rf = max(0, 5 - self._ss.cnt("prompts_used"))
         if self._rf > 0:
-            self._rf -= 1
             self._su()
             self._c.print(f"[blue]Free prompts remaining: {self._rf}[/blue]")
             return True
@@ -134,49 +865,30 @@ class _LM:
             self._c.print("[bold cyan]Telegram: t.me/JadXHex[/bold cyan]")
             t = Prompt.ask("[bold]Enter license token[/bold]", password=False).strip()
             if t:
-                e = self._vt(t)
-                if e and e >= date.today():
-                    try:
-                        with open(".aicode_license", "w") as f:
-                            f.write(t)
-                        self._l = True
-                        self._ed = e
-                        self._c.print(f"[green]License activated until {e.isoformat()}[/green]")
-                        up = Path(".aicode_usage.json")
-                        if up.exists():
-                            up.unlink()
-                        return True
-                    except Exception as ex:
-                        self._c.print(f"[red]Save error: {ex}[/red]")
-                else:
-                    self._c.print("[red]Invalid token[/red]")
+                return self.activate(t)
             return False
     
     def check_licensed(self) -> bool:
         return self._l
 
 class _TM:
-    def __init__(self, cfg: Config, c: Console):
+    def __init__(self, cfg: Config, c: Console, ss: _SS):
         self._cfg = cfg
         self._c = c
+        self._ss = ss
         self._ts: list[str] = []
         self._at: Optional[str] = None
         self._cl: Optional[Groq] = None
     
     def load_from_env(self) -> bool:
         self._lde()
-        aks = os.getenv("GROQ_API_KEYS")
-        if aks:
-            self._ts = [k.strip() for k in aks.split(',') if k.strip()]
-            if self._ts:
-                self._at = self._ts[0]
-                return True
-        
-        t = os.getenv("GROQ_API_KEY")
-        if t:
-            self._ts = [t]
-            self._at = t
-            set_key(self._cfg._ef, "GROQ_API_KEYS", t)
+        aks = os.getenv("GROQ_API_KEYS") or os.getenv("GROQ_API_KEY") or ""
+        ts = [k.strip() for k in aks.split(',') if k.strip() and k.strip() != "your_groq_api_key_here"]
+        for k in ts:
+            self._ss.add_key(k)
+        self._ts = list(dict.fromkeys(ts + self._ss.keys()))
+        if self._ts:
+            self._at = self._ts[0]
             return True
         return False
     
@@ -186,8 +898,8 @@ class _TM:
             load_dotenv(dotenv_path=ep)
     
     def _st(self) -> None:
-        if self._ts:
-            set_key(self._cfg._ef, "GROQ_API_KEYS", ','.join(self._ts))
+        for k in self._ts:
+            self._ss.add_key(k)
     
     def prompt_for_token(self) -> None:
         self._c.print("[bold cyan]Groq console: https://console.groq.com[/bold cyan]")
@@ -204,6 +916,9 @@ class _TM:
         if not self._at:
             self._c.print("[red]No token[/red]")
             return False
+        if Groq is None:
+            self._c.print("[red]groq package not installed[/red]")
+            return False
         try:
             self._cl = Groq(api_key=self._at, timeout=self._cfg._ct)
             self._c.print("[green]Client initialized[/green]")
@@ -212,33 +927,101 @@ class _TM:
             self._c.print(f"[red]Init failed: {ex}[/red]")
             return False
 
+class _GI:
+    def __init__(self):
+        self._r: list = []
+    
+    def add(self, b: str, p: Path) -> None:
+        try:
+            ls = p.read_text(encoding="utf-8", errors="replace").splitlines()
+        except OSError:
+            return
+        for ln in ls:
+            ln = ln.rstrip()
+            if not ln or ln.startswith("#"):
+                continue
+            ng = ln.startswith("!")
+            ln = ln[1:] if ng else ln.replace("\\#", "#")
+            do = ln.endswith("/")
+            ln = ln.rstrip("/")
+            if not ln:
+                continue
+            rx = _gre(ln.lstrip("/")) if "/" in ln else "(?:.*/)?" + _gre(ln)
+            self._r.append((b, re.compile(rx), ng, do))
+    
+    def hit(self, rp: str, isd: bool) -> bool:
+        ig = False
+        for b, rx, ng, do in self._r:
+            if do and not isd:
+                continue
+            if b:
+                if not rp.startswith(b + "/"):
+                    continue
+                if rx.match(rp[len(b) + 1:]):
+                    ig = not ng
+            elif rx.match(rp):
+                ig = not ng
+        return ig
+
 class _FM:
-    def __init__(self, c: Console, cfg: Config):
+    _SD = tuple(Path(s) for s in ('/etc', '/sys', '/proc', '/dev', '/bin', '/sbin', '/boot'))
+    _DE = frozenset(['.exe', '.dll', '.so', '.dylib', '.bat', '.cmd', '.sh', '.ps1'])
+    _GC = re.compile(r'[*?\[]')
+    
+    def __init__(self, c: Console, cfg: Config, cf: Optional[Callable] = None):
         self._c = c
         self._cfg = cfg
+        self._cf = cf or (lambda q, d=False, au=True: Confirm.ask(q, default=d))
         self._cc: Optional[str] = None
         self._cp: Optional[str] = None
+        self._xs: dict = {}
+        self._fs: dict = {}
+        self._rt = Path.cwd().resolve()
         self._bd = Path(".aicode_backups")
         if cfg._be:
             self._bd.mkdir(exist_ok=True)
     
-    def _isp(self, fp: str) -> Tuple[bool, str]:
+    def _isp(self, fp: str, rd: Optional[dict] = None) -> Tuple[bool, str]:
         try:
-            p = Path(fp).resolve()
-            cwd = Path.cwd().resolve()
-            if not str(p).startswith(str(cwd)):
+            p = Path(fp)
+            if rd is None or p.name in ("", ".", ".."):
+                p = p.resolve()
+            else:
+                k = str(p.parent)
+                if k not in rd:
+                    rd[k] = p.parent.resolve()
+                p = rd[k] / p.name
+                if p.is_symlink():
+                    p = p.resolve()
+            if not _irt(p, self._rt):
                 return False, "Path traversal detected"
-            sd = ['/etc', '/sys', '/proc', '/dev', '/bin', '/sbin', '/boot']
-            for s in sd:
-                if str(p).startswith(s):
-                    return False, f"System directory blocked"
-            de = ['.exe', '.dll', '.so', '.dylib', '.bat', '.cmd', '.sh', '.ps1']
-            if p.suffix.lower() in de:
+            if any(_irt(p, s) for s in self._SD):
+                return False, f"System directory blocked"
+            if p.suffix.lower() in self._DE:
                 return False, f"File type blocked"
             return True, ""
         except Exception as ex:
             return False, f"Invalid path: {ex}"
     
+    def _ign(self, fp: str) -> bool:
+        try:
+            rp = Path(fp).resolve().relative_to(self._rt)
+        except (ValueError, OSError):
+            return True
+        if any(x.startswith(".") for x in Path(os.path.normpath(fp)).parts + rp.parts if x not in (".", "..")):
+            return True
+        gi, a = _GI(), ""
+        for i, x in enumerate(rp.parts):
+            gi.add(a.rstrip("/"), self._rt / a / ".gitignore")
+            a += x + "/"
+            if gi.hit(a.rstrip("/"), i < len(rp.parts) - 1 or (self._rt / a).is_dir()):
+                return True
+        return False
+    
+    def _isps(self, fps: list) -> list:
+        rd: dict = {}
+        return [self._isp(fp, rd) for fp in fps]
+    
     def _cfs(self, fp: str) -> Tuple[bool, str]:
         try:
             p = Path(fp)
@@ -250,21 +1033,28 @@ class _FM:
         except Exception as ex:
             return False, f"Size check error: {ex}"
     
-    def _cb(self, fp: str) -> bool:
+    @_pf.wrap("backup")
+    def _cb(self, fp: str, qt: bool = False) -> bool:
         if not self._cfg._be:
             return True
         try:
             p = Path(fp)
             if p.exists():
                 ts = time.strftime("%Y%m%d_%H%M%S")
-                bn = f"{p.stem}_{ts}{p.suffix}.backup"
-                bp = self._bd / bn
-                with open(p, 'r', encoding='utf-8') as src:
+                with open(p, 'r', encoding='utf-8', newline='') as src:
                     ct = src.read()
-                with open(bp, 'w', encoding='utf-8') as dst:
-                    dst.write(ct)
-                self._c.print(f"[blue]Backup: {bp}[/blue]")
-                return True
+                ph = hashlib.sha256(os.path.relpath(p.resolve()).encode()).hexdigest()[:8]
+                i = 0
+                while True:
+                    bp = self._bd / f"{p.stem}_{ph}_{ts}{'_' + str(i) if i else ''}{p.suffix}.backup"
+                    try:
+                        _aw(bp, ct, ex=True, nl="")
+                        break
+                    except FileExistsError:
+                        i += 1
+                if not qt:
+                    self._c.print(f"[blue]Backup: {bp}[/blue]")
+            return True
         except Exception as ex:
             self._c.print(f"[yellow]Backup failed: {ex}[/yellow]")
             return False
@@ -286,6 +1076,84 @@ class _FM:
             return False, "Filename too long"
         return True, ""
     
+    def _xp(self, pt: str) -> list:
+        p = Path(pt)
+        rx, dp = None, None
+        if not p.is_dir():
+            ps = p.parts
+            i = next((i for i, x in enumerate(ps) if self._GC.search(x)), len(ps))
+            if i == len(ps):
+                return [pt] if p.is_file() and self._isp(pt)[0] and self._cfs(pt)[0] else []
+            p = Path(*ps[:i]) if i else Path(".")
+            rx = re.compile(_gre('/'.join(ps[i:])))
+            dp = None if any("**" in x for x in ps[i:]) else len(ps) - i - 1
+        if not p.is_dir() or not self._isp(str(p))[0]:
+            return []
+        br = p.resolve().relative_to(self._rt).as_posix()
+        br = "" if br == "." else br + "/"
+        gi, a = _GI(), ""
+        for x in br.split("/")[:-1]:
+            gi.add(a.rstrip("/"), self._rt / a / ".gitignore")
+            a += x + "/"
+        out, st, mx = [], [(str(p), "")], self._cfg._mfs
+        while st:
+            d, rl = st.pop()
+            if (Path(d) / ".gitignore").is_file():
+                gi.add((br + rl).rstrip("/"), Path(d) / ".gitignore")
+            try:
+                es = list(os.scandir(d))
+            except OSError:
+                continue
+            for e in es:
+                r = rl + e.name
+                if e.is_dir(follow_symlinks=False):
+                    if (dp is None or r.count("/") < dp) and not (
+                            e.name.startswith(".") or e.name == "__pycache__" or gi.hit(br + r, True)):
+                        st.append((e.path, r + "/"))
+                    continue
+                if e.name.startswith(".aicode") or (rx and not rx.match(r)) or gi.hit(br + r, False):
+                    continue
+                try:
+                    if not e.is_file() or e.stat().st_size > mx:
+                        continue
+                except OSError:
+                    continue
+                if e.is_symlink():
+                    if not self._isp(e.path)[0]:
+                        continue
+                elif os.path.splitext(e.name)[1].lower() in self._DE:
+                    continue
+                out.append(os.path.normpath(e.path))
+        return sorted(out)
+    
+    def _tgs(self, sp: str) -> list:
+        out = []
+        for x in sp.split(","):
+            x = x.strip()
+            if x:
+                out += self._xp(x) if self._GC.search(x) else [x]
+        return list(dict.fromkeys(out))
+    
+    def cx(self, mx: int = 2000, d: str = "", ck: bool = True, sn: Optional[set] = None) -> Optional[str]:
+        fs = ([(self._cp, self._cc)] if self._cc else []) + list(self._xs.items())
+        if not fs:
+            return None
+        out, n = [], 0
+        for fp, ct in fs:
+            if n >= self._cfg._rmc:
+                out.append(f"... ({len(fs) - len(out)} more files not shown)")
+                break
+            if ck and self._cfg._cpt:
+                cc = _CM.run(fp, ct, d)[0]
+                _CM.rep(self._c, fp, ct, cc)
+                ct = cc
+            elif sn is not None and len(ct) <= mx:
+                sn.add(str(Path(fp).resolve()))
+            out.append(_PT.ctx(fp, ct, mx))
+            n += len(out[-1])
+        return "\n\n".join(out)
+    
+    @_pf.wrap("extract")
     def _ecfr(self, r: str) -> str:
         cbp = r'```(?:\w+)?\n(.*?)```'
         m = re.findall(cbp, r, re.DOTALL)
@@ -293,7 +1161,47 @@ class _FM:
             return m[0].strip()
         return r.strip()
     
+    def mark(self, fp: str, ct: Optional[str] = None) -> None:
+        p = Path(fp)
+        try:
+            st = p.stat()
+            self._fs[str(p.resolve())] = ((st.st_mtime_ns, st.st_size),
+                                          ct if ct is not None else p.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            self._fs[str(p.resolve())] = (None, None)
+        except (OSError, UnicodeDecodeError):
+            self._fs.pop(str(p.resolve()), None)
+    
+    def _occ(self, p: Path, cc: str) -> Optional[str]:
+        k = str(p.resolve())
+        if k not in self._fs:
+            return cc
+        sp, bc = self._fs[k]
+        try:
+            st = p.stat()
+            if sp == (st.st_mtime_ns, st.st_size):
+                return cc
+            tc = p.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return cc
+        except (OSError, UnicodeDecodeError):
+            tc = None
+        if tc == bc or tc == cc:
+            return cc
+        mg = _m3(bc, cc, tc) if bc is not None and tc is not None else None
+        if mg is not None:
+            self._c.print(f"[yellow]{p} changed on disk since it was loaded; changes merge cleanly[/yellow]")
+            if self._cf("[yellow]Save merged result?[/yellow]", True, True):
+                return mg
+        else:
+            self._c.print(f"[red]{p} changed on disk since it was loaded; changes conflict[/red]")
+            if self._cf("[yellow]Overwrite the other changes?[/yellow]", False, False):
+                return cc
+        return None
+    
     def load(self, fp: str) -> bool:
+        if self._GC.search(fp) or "," in fp:
+            return self.load_many(self._tgs(fp))
         iss, em = self._isp(fp)
         if not iss:
             self._c.print(f"[red]Security: {em}[/red]")
@@ -310,6 +1218,8 @@ class _FM:
             with open(p, "r", encoding="utf-8") as f:
                 self._cc = f.read()
             self._cp = str(p)
+            self._xs = {}
+            self.mark(fp, self._cc)
             self._c.print(f"[green]Loaded: {fp} ({len(self._cc)} chars)[/green]")
             return True
         except UnicodeDecodeError:
@@ -319,8 +1229,27 @@ class _FM:
             self._c.print(f"[red]Load failed: {ex}[/red]")
             return False
     
+    def load_many(self, fps: list) -> bool:
+        if not fps:
+            self._c.print("[red]No matching files[/red]")
+            return False
+        if not self.load(fps[0]):
+            return False
+        xs = {}
+        for fp, (ok, em) in zip(fps[1:], self._isps(fps[1:])):
+            try:
+                if ok and self._cfs(fp)[0]:
+                    xs[fp] = Path(fp).read_text(encoding="utf-8")
+            except (OSError, UnicodeDecodeError):
+                continue
+        self._xs = xs
+        if xs:
+            self._c.print(f"[green]Also loaded {len(xs)} files as context[/green]")
+        return True
+    
+    @_pf.wrap("save")
     def save(self, ct: Optional[str] = None, fp: Optional[str] = None, 
-             fc: bool = False) -> bool:
+             fc: bool = False, rw: bool = False) -> bool:
         if ct is None:
             ct = self._cc
         if ct is None:
@@ -339,15 +1268,22 @@ class _FM:
             return False
         p = Path(fp)
         if p.exists() and not fc:
-            if not Confirm.ask(f"[yellow]Overwrite {fp}?[/yellow]"):
+            if not self._cf(f"[yellow]Overwrite {fp}?[/yellow]"):
                 self._c.print("[yellow]Cancelled[/yellow]")
                 return False
             self._cb(fp)
         try:
             p.parent.mkdir(parents=True, exist_ok=True)
-            cc = self._ecfr(ct)
-            with open(p, "w", encoding="utf-8") as f:
-                f.write(cc)
+            cc = ct if rw else self._ecfr(ct)
+            if cc and not cc.endswith("\n"):
+                cc += "\n"
+            with _flk(p):
+                cc = self._occ(p, cc)
+                if cc is None:
+                    self._c.print("[yellow]Save aborted; reload the file and retry[/yellow]")
+                    return False
+                _aw(p, cc)
+                self.mark(fp, cc)
             self._c.print(f"[green]Saved: {fp} ({len(cc)} chars)[/green]")
             if str(p) != self._cp:
                 self._cp = str(p)
@@ -360,6 +1296,7 @@ class _FM:
     def clear(self) -> None:
         self._cc = None
         self._cp = None
+        self._xs = {}
         self._c.print("[green]Cleared[/green]")
     
     def update_from_response(self, r: str, ui: str, dn: str = "generated_code.py") -> None:
@@ -369,32 +1306,1379 @@ class _FM:
                 self._cp = dn
             self._c.print(f"[blue]Content updated[/blue]")
 
+class _TG:
+    _DT = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+    _FW = re.compile(r'\b(?:rename|everywhere|throughout|across|globally|whole|entire|all (?:\w+ )?(?:uses|usages|'
+                     r'occurrences|references|calls|callers|call sites)|every (?:use|usage|occurrence|call|caller)|'
+                     r'callers|call sites|usages|(?:this|the) file)\b', re.I)
+    
+    @classmethod
+    def _defs(cls, tree: ast.Module) -> list:
+        out = []
+        
+        def walk(b, px, par):
+            for n in b:
+                if isinstance(n, cls._DT):
+                    out.append((px + n.name, n, par))
+                    walk(n.body, px + n.name + ".", n)
+        walk(tree.body, "", None)
+        return out
+    
+    @staticmethod
+    def _span(n: ast.AST) -> Tuple[int, int]:
+        return min([n.lineno] + [d.lineno for d in getattr(n, "decorator_list", ())]) - 1, n.end_lineno
+    
+    @classmethod
+    def _sig(cls, ls: list, n: ast.AST) -> str:
+        s = cls._span(n)[0]
+        e = max(n.lineno, cls._span(n.body[0])[0])
+        return "\n".join(ls[s:e]).rstrip()
+    
+    @classmethod
+    def find(cls, src: str, tg: str, fn: str) -> Optional[Tuple[int, int, str]]:
+        ls = src.splitlines()
+        m = re.fullmatch(r'(\d+)(?:-(\d+))?', tg)
+        if m:
+            s, e = int(m.group(1)) - 1, int(m.group(2) or m.group(1))
+            return (s, e, "") if 0 <= s < e <= len(ls) else None
+        if not fn.endswith(".py"):
+            return None
+        try:
+            tree = ast.parse(src)
+        except SyntaxError:
+            return None
+        for q, n, par in cls._defs(tree):
+            if q != tg:
+                continue
+            cx = []
+            if par:
+                cx.append(cls._sig(ls, par))
+                sb = par.body
+            else:
+                cx += [ls[x.lineno - 1] for x in tree.body if isinstance(x, (ast.Import, ast.ImportFrom))]
+                sb = tree.body
+            for x in sb:
+                if isinstance(x, cls._DT):
+                    cx.append(cls._sig(ls, x) + (" ...  # <- target" if x is n else " ..."))
+            s, e = cls._span(n)
+            return s, e, "\n".join(cx)
+        return None
+    
+    @classmethod
+    def guess(cls, src: str, d: str, fn: str, ml: int = 60) -> Optional[str]:
+        if not fn.endswith(".py") or src.count("\n") < ml:
+            return None
+        try:
+            ds = cls._defs(ast.parse(src))
+        except SyntaxError:
+            return None
+        if cls._FW.search(d):
+            return None
+        ws = set(re.findall(r'[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*', d))
+        ws |= {w.rsplit('.', 1)[-1] for w in ws}
+        hs = {q for q, _, _ in ds if q in ws or q.rsplit('.', 1)[-1] in ws}
+        return hs.pop() if len(hs) == 1 else None
+    
+    @staticmethod
+    def stub(n: ast.AST) -> bool:
+        if not isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            return False
+        b = n.body[1:] if _CM._doc(n) else n.body
+        return not b or len(b) == 1 and (isinstance(b[0], ast.Pass) or isinstance(b[0], ast.Expr)
+                                          and isinstance(b[0].value, ast.Constant) and b[0].value.value is Ellipsis)
+    
+    @staticmethod
+    def region(src: str, s: int, e: int) -> str:
+        return textwrap.dedent(''.join(src.splitlines(keepends=True)[s:e]))
+    
+    @staticmethod
+    def splice(src: str, s: int, e: int, nc: str) -> str:
+        ls = src.splitlines(keepends=True)
+        ind = re.match(r'[ \t]*', ls[s]).group() if s < len(ls) else ""
+        nl = textwrap.indent(textwrap.dedent(nc.strip('\n')), ind) + '\n'
+        return ''.join(ls[:s]) + nl + ''.join(ls[e:])
+
+class _CM:
+    _RX = re.compile(r'__aicode_(\d+)__')
+    _BX = re.compile(r'^[ \t]*\.\.\.[ \t]*#[ \t]*__aicode_(\d+)__[ \t]*$\n?', re.M)
+    _LC = {".js": "//", ".mjs": "//", ".jsx": "//", ".ts": "//", ".tsx": "//", ".java": "//", ".kt": "//",
+           ".c": "//", ".h": "//", ".cpp": "//", ".hpp": "//", ".cs": "//", ".go": "//", ".rs": "//",
+           ".swift": "//", ".php": "//", ".sh": "#", ".rb": "#", ".pl": "#", ".yaml": "#", ".yml": "#",
+           ".toml": "#"}
+    _ML = 4
+    _MN = 20
+    _MS = 300
+    
+    @classmethod
+    def run(cls, fn: str, ct: str, d: str = "", tv: bool = True, el: bool = True) -> Tuple[str, dict]:
+        if fn.endswith(".py"):
+            try:
+                return cls._py(ct, d, tv, el)
+            except (SyntaxError, ValueError, tokenize.TokenError, IndentationError):
+                pass
+        return (cls._gen(fn, ct) if tv else ct), {}
+    
+    @classmethod
+    def restore(cls, r: str, mp: dict) -> Optional[str]:
+        if not mp:
+            return r
+        if set(cls._RX.findall(r)) != set(mp):
+            return None
+        r = cls._BX.sub(lambda m: mp[m.group(1)], r)
+        return cls._RX.sub(lambda m: mp[m.group(1)], r)
+    
+    @classmethod
+    def _gen(cls, fn: str, ct: str) -> str:
+        lc = cls._LC.get(Path(fn).suffix.lower())
+        if lc == "//":
+            ct = re.sub(r'^[ \t]*/\*(?:(?!\*/).)*\*/[ \t]*$', '', ct, flags=re.S | re.M)
+        return "\n".join(l.rstrip() for l in ct.splitlines() if l.strip() and not (lc and l.lstrip().startswith(lc)))
+    
+    @classmethod
+    def _py(cls, ct: str, d: str, tv: bool, el: bool) -> Tuple[str, dict]:
+        tree = ast.parse(ct)
+        ls = ct.splitlines(keepends=True)
+        of = [0]
+        for l in ls:
+            of.append(of[-1] + len(l))
+        
+        def at(ln, co):
+            return of[ln - 1] + len(ls[ln - 1].encode()[:co].decode(errors="ignore"))
+        
+        ed, mp, sk = [], {}, []
+        
+        def put(a, b, o, rp):
+            k = str(len(mp))
+            mp[k] = o
+            ed.append((a, b, rp.replace("{k}", f"__aicode_{k}__")))
+            sk.append((a, b))
+        
+        if el:
+            ws = {w.lower() for w in re.findall(r'[A-Za-z_]\w*', d)}
+            ds = [(q, n) for q, n, _ in _TG._defs(tree) if not isinstance(n, ast.ClassDef)]
+            rl = {q for q, n in ds if n.name.lower() in ws}
+            for q, n in ds if rl else ():
+                b = n.body[1:] if cls._doc(n) and len(n.body) > 1 else n.body
+                s = b[0].lineno
+                if q in rl or s <= n.lineno or n.end_lineno - s + 1 < cls._ML:
+                    continue
+                if any(q.startswith(x + ".") for x in rl) or any(a <= of[s - 1] < e for a, e in sk):
+                    continue
+                ind = re.match(r'[ \t]*', ls[s - 1]).group()
+                put(of[s - 1], of[n.end_lineno], "".join(ls[s - 1:n.end_lineno]), ind + ("..." if tv else "...  # {k}") + "\n")
+        sd = {id(v) for x in ast.walk(tree) if isinstance(x, ast.JoinedStr) for v in x.values}
+        if tv:
+            sd |= {id(x.body[0].value) for x in ast.walk(tree) if isinstance(x, (ast.Module, *_TG._DT)) and cls._doc(x)}
+        for n in ast.walk(tree):
+            if id(n) in sd:
+                continue
+            if isinstance(n, (ast.List, ast.Tuple, ast.Set, ast.Dict)):
+                big = len(n.keys if isinstance(n, ast.Dict) else n.elts) > cls._MN
+            elif isinstance(n, ast.Constant) and isinstance(n.value, (str, bytes)):
+                big = len(n.value) > cls._MS
+            else:
+                continue
+            if not big or n.end_lineno - n.lineno < 2:
+                continue
+            a, b = at(n.lineno, n.col_offset), at(n.end_lineno, n.end_col_offset)
+            if any(x <= a < y for x, y in sk):
+                continue
+            put(a, b, ct[a:b], "..." if tv else "{k}")
+        for a, b, rp in sorted(ed, reverse=True):
+            ct = ct[:a] + rp + ct[b:]
+        return (cls._triv(ct), {}) if tv else (ct, mp)
+    
+    @staticmethod
+    def _doc(n: ast.AST) -> bool:
+        return bool(n.body) and isinstance(n.body[0], ast.Expr) and isinstance(n.body[0].value, ast.Constant) \
+            and isinstance(n.body[0].value.value, str)
+    
+    @classmethod
+    def _triv(cls, ct: str) -> str:
+        tree = ast.parse(ct)
+        ls = ct.splitlines()
+        dl = set()
+        for n in [tree] + [x for x in ast.walk(tree) if isinstance(x, _TG._DT)]:
+            if not cls._doc(n) or len(n.body) < 2:
+                continue
+            d = n.body[0]
+            if ls[d.lineno - 1].encode()[:d.col_offset].strip() or n.body[1].lineno <= d.end_lineno:
+                continue
+            dl.update(range(d.lineno, d.end_lineno + 1))
+        for t in tokenize.generate_tokens(io.StringIO(ct).readline):
+            if t.type == tokenize.COMMENT:
+                r, c = t.start
+                ls[r - 1] = ls[r - 1][:c]
+        out, im = [], set()
+        for i, l in enumerate(ls, 1):
+            l = l.rstrip()
+            if not l or i in dl:
+                continue
+            if l.startswith(("import ", "from ")):
+                if l in im:
+                    continue
+                im.add(l)
+            out.append(l)
+        return "\n".join(out)
+    
+    @classmethod
+    def rep(cls, c, fp: str, a: str, b: str) -> None:
+        ta, tb = _MR.est(a), _MR.est(b)
+        if tb < ta:
+            c.print(f"[blue]Compacted {escape(fp)}: ~{ta} -> ~{tb} tokens (saved ~{ta - tb})[/blue]")
+
+class _LX:
+    _FW = {"please", "can", "could", "would", "you", "the", "this", "that", "my", "file", "code", "in", "of",
+           "for", "me", "all", "a", "an", "are", "there", "is", "it", "does", "have", "has", "now", "up"}
+    _IN = (("_fmt", re.compile(r'(?:re|auto)?format|run (?:black|ruff|formatter)|format with (?:black|ruff|formatter)')),
+           ("_srt", re.compile(r'(?:sort|organi[sz]e|order|fix) imports')),
+           ("_tws", re.compile(r'(?:remove|strip|trim|delete|clean|fix) trailing (?:white ?spaces?|spaces?)')),
+           ("_cnt", re.compile(r'count lines|how many lines|line count|lines count|number lines')))
+    _FT = {".py": ["ruff format --quiet -", "black -q -"], ".pyw": ["ruff format --quiet -", "black -q -"],
+           ".js": ["prettier --stdin-filepath {f}"], ".ts": ["prettier --stdin-filepath {f}"],
+           ".css": ["prettier --stdin-filepath {f}"], ".go": ["gofmt"], ".rs": ["rustfmt --emit stdout"]}
+    
+    @classmethod
+    def match(cls, ui: str, fp: str) -> Optional[str]:
+        nw = set(re.findall(r'[a-z]+', Path(fp).name.lower()))
+        s = " ".join(w for w in re.findall(r'[a-z]+', ui.lower()) if w not in cls._FW and w not in nw)
+        return next((k for k, rx in cls._IN if rx.fullmatch(s)), None)
+    
+    @classmethod
+    def run(cls, ui: str, fp: str, ct: str) -> Optional[Tuple[Optional[str], str]]:
+        k = cls.match(ui, fp)
+        if not k:
+            return None
+        t0 = time.perf_counter()
+        r = getattr(cls, k)(fp, ct)
+        if r is None:
+            return None
+        return r[0], f"{r[1]} ({(time.perf_counter() - t0) * 1000:.0f} ms, no model call)"
+    
+    @staticmethod
+    def _tool(cs: list, fp: str, ct: str) -> Tuple[Optional[str], str]:
+        for c in cs:
+            a = shlex.split(c.replace("{f}", shlex.quote(fp)))
+            if not shutil.which(a[0]):
+                continue
+            try:
+                p = subprocess.run(a, input=ct, capture_output=True, text=True, timeout=60)
+            except (OSError, subprocess.TimeoutExpired):
+                continue
+            if p.returncode == 0 and p.stdout.strip():
+                return p.stdout, a[0]
+        return None, ""
+    
+    @classmethod
+    def _fmt(cls, fp: str, ct: str) -> Optional[Tuple[str, str]]:
+        ex = Path(fp).suffix.lower()
+        ev = os.getenv(f"AICODE_FORMAT_{ex.lstrip('.').upper()}")
+        r, tl = cls._tool([ev] if ev else cls._FT.get(ex, []), fp, ct)
+        return (r, f"formatted with {tl}") if r is not None else None
+    
+    @classmethod
+    def _srt(cls, fp: str, ct: str) -> Optional[Tuple[str, str]]:
+        if not fp.endswith(".py"):
+            return None
+        r, tl = cls._tool(["isort -q -"], fp, ct)
+        if r is not None:
+            return r, f"sorted imports with {tl}"
+        try:
+            tree = ast.parse(ct)
+        except SyntaxError:
+            return None
+        ls = ct.splitlines(keepends=True)
+        bs, cu = [], []
+        for n in tree.body:
+            if isinstance(n, (ast.Import, ast.ImportFrom)) and n.lineno == n.end_lineno and not n.col_offset \
+                    and ";" not in ls[n.lineno - 1]:
+                if cu and n.lineno != cu[-1].lineno + 1:
+                    bs.append(cu)
+                    cu = []
+                cu.append(n)
+            elif cu:
+                bs.append(cu)
+                cu = []
+        bs.append(cu)
+        
+        def key(n):
+            m = n.module or "" if isinstance(n, ast.ImportFrom) else n.names[0].name
+            return m != "__future__", isinstance(n, ast.ImportFrom), m.lower(), ls[n.lineno - 1]
+        
+        for b in bs[::-1]:
+            if len(b) > 1:
+                sl = list(dict.fromkeys(ls[n.lineno - 1].rstrip() + "\n" for n in sorted(b, key=key)))
+                ls[b[0].lineno - 1:b[-1].lineno] = sl
+        return "".join(ls), "sorted imports"
+    
+    @staticmethod
+    def _tws(fp: str, ct: str) -> Tuple[str, str]:
+        ls = ct.splitlines(keepends=True)
+        out = [re.sub(r'[ \t\f\v]+(?=\r?\n?$)', '', l) for l in ls]
+        n = sum(a != b for a, b in zip(ls, out))
+        return (''.join(out) if n else ct), f"removed trailing whitespace on {n} lines"
+    
+    @staticmethod
+    def _cnt(fp: str, ct: str) -> Tuple[None, str]:
+        ls = ct.splitlines()
+        bl = sum(not l.strip() for l in ls)
+        cm = sum(l.strip().startswith(("#", "//")) for l in ls)
+        return None, f"{fp}: {len(ls)} lines ({len(ls) - bl - cm} code, {bl} blank, {cm} comment), {len(ct)} chars"
+
+def _vck(k: str, fn: str, ct: str, cmd: Optional[str]) -> Tuple[str, bool, str]:
+    if cmd is None:
+        try:
+            if fn.endswith(".json"):
+                json.loads(ct)
+            else:
+                compile(ct, fn, "exec", dont_inherit=True)
+            return k, True, ""
+        except SyntaxError as ex:
+            return k, False, f"{fn}:{ex.lineno}:{ex.offset}: {ex.msg}\n{(ex.text or '').rstrip()}"
+        except ValueError as ex:
+            return k, False, f"{fn}: {ex}"
+    with tempfile.TemporaryDirectory(prefix="aicode_v") as td:
+        tp = Path(td) / fn
+        tp.parent.mkdir(parents=True, exist_ok=True)
+        tp.write_text(ct, encoding="utf-8")
+        ev = dict(os.environ)
+        ev["PYTHONPATH"] = os.pathsep.join(filter(None, [td, os.getcwd(), ev.get("PYTHONPATH")]))
+        try:
+            p = subprocess.run(shlex.split(cmd.replace("{f}", shlex.quote(str(tp)))), capture_output=True,
+                               text=True, timeout=120, env=ev)
+        except FileNotFoundError as ex:
+            return k, False, f"{cmd}: {ex}"
+        except subprocess.TimeoutExpired:
+            return k, False, f"{cmd}: timed out"
+        o = (p.stdout + p.stderr).replace(str(tp), fn).strip()
+        return k, p.returncode == 0, o[-2000:]
+
+def _dsz(a: str, b: str) -> Tuple[int, int]:
+    ad = rm = 0
+    for t, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a.splitlines(), b.splitlines(),
+                                                     autojunk=False).get_opcodes():
+        if t != "equal":
+            rm += i2 - i1
+            ad += j2 - j1
+    return ad, rm
+
+class _VP:
+    _SY = {".py": None, ".pyw": None, ".json": None,
+           ".js": "node --check {f}", ".mjs": "node --check {f}", ".cjs": "node --check {f}",
+           ".php": "php -l {f}", ".rb": "ruby -c {f}", ".pl": "perl -c {f}"}
+    _LN = {".py": ["ruff check --quiet --no-cache {f}", "pyflakes {f}"],
+           ".js": ["eslint --no-eslintrc {f}"]}
+    
+    def __init__(self, c: Console, cfg: Config):
+        self._c = c
+        self._cfg = cfg
+        self._px = None
+    
+    def _pool(self):
+        if self._px is None:
+            try:
+                self._px = ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+            except (OSError, ImportError, NotImplementedError):
+                self._px = ThreadPoolExecutor(max_workers=4)
+            atexit.register(self._px.shutdown, wait=False)
+        return self._px
+    
+    def reset(self) -> None:
+        px, self._px = self._px, None
+        if px is None:
+            return
+        ps = list((getattr(px, "_processes", None) or {}).values())
+        _sdn(px)
+        for p in ps:
+            p.terminate()
+    
+    @staticmethod
+    def _hc(cmd: str) -> bool:
+        return shutil.which(shlex.split(cmd)[0]) is not None
+    
+    def jobs(self, fn: str, ln: bool = False) -> list:
+        ex = Path(fn).suffix.lower()
+        ek = ex.lstrip('.').upper()
+        js = []
+        sc = os.getenv(f"AICODE_CHECK_{ek}", self._SY.get(ex, ""))
+        if sc is None or (sc and self._hc(sc)):
+            js.append(("syntax", sc))
+        if self._cfg._vln or ln:
+            lc = os.getenv(f"AICODE_LINT_{ek}")
+            for lc in [lc] if lc else self._LN.get(ex, []):
+                if self._hc(lc):
+                    js.append(("lint", lc))
+                    break
+        if self._cfg._vtc:
+            js.append(("test", self._cfg._vtc))
+        return js
+    
+    @_pf.wrap("validate")
+    def run(self, fn: str, ct: str) -> Tuple[bool, str]:
+        js = self.jobs(fn)
+        if not js:
+            return True, ""
+        rn = Path(fn).as_posix().lstrip('/')
+        try:
+            fs = [self._pool().submit(_vck, k, rn, ct, cmd) for k, cmd in js]
+            rs = [f.result() for f in fs]
+        except BrokenProcessPool:
+            self._px = ThreadPoolExecutor(max_workers=4)
+            rs = list(self._px.map(lambda j: _vck(j[0], rn, ct, j[1]), js))
+        es = [f"[{k}] {m}" for k, ok, m in rs if not ok]
+        self._c.print("[blue]Checks: " + ', '.join(f"{k}={'ok' if ok else 'FAIL'}" for k, ok, _ in rs) + "[/blue]")
+        return not es, "\n\n".join(es)
+    
+    @_pf.wrap("validate")
+    def score(self, fn: str, cts: list, bs: str = "") -> list:
+        js = self.jobs(fn, True)
+        rn = Path(fn).as_posix().lstrip('/')
+        try:
+            px = self._pool()
+            fs = [[px.submit(_vck, k, rn, ct, cmd) for k, cmd in js] for ct in cts]
+            ds = [px.submit(_dsz, bs, ct) for ct in cts]
+            return [({k: ok for k, ok, _ in (f.result() for f in fr)}, d.result()) for fr, d in zip(fs, ds)]
+        except BrokenProcessPool:
+            self._px = ThreadPoolExecutor(max_workers=4)
+            return self.score(fn, cts, bs)
+
+@dataclass
+class _RS:
+    t: str
+    m: str
+    b: str
+    pt: int = 0
+    ct: int = 0
+    cpt: Optional[int] = None
+    lat: float = 0.0
+    rl: dict = field(default_factory=dict)
+    tc: Optional[list] = None
+
+class _SR:
+    def __init__(self, be: '_BE', g: Iterator, m: str, rl: dict, cf: Callable = None):
+        self._be = be
+        self._g = g
+        self._cf = cf
+        self._t0 = time.time()
+        self.rs = _RS("", m, be.n, rl=rl)
+    
+    def __iter__(self) -> Iterator[str]:
+        ps = []
+        try:
+            for d, u in self._g:
+                if u:
+                    self.rs.pt, self.rs.ct = u
+                if d:
+                    ps.append(d)
+                    yield d
+        finally:
+            self.rs.t = ''.join(ps)
+            self.rs.lat = time.time() - self._t0
+            self._be._acc(self.rs)
+    
+    def close(self) -> None:
+        if self._cf:
+            try:
+                self._cf()
+            except Exception:
+                pass
+
+class _BE:
+    n = "base"
+    
+    def __init__(self):
+        self._lk = threading.Lock()
+        self._u = {"n": 0, "pt": 0, "ct": 0}
+        self._rl: dict = {}
+    
+    def ready(self) -> bool:
+        return True
+    
+    def chat(self, ms: list, m: str, **kw) -> _RS:
+        raise NotImplementedError
+    
+    def stream(self, ms: list, m: str, **kw) -> _SR:
+        raise NotImplementedError
+    
+    def usage(self) -> dict:
+        with self._lk:
+            return dict(self._u)
+    
+    def limits(self) -> dict:
+        with self._lk:
+            return dict(self._rl)
+    
+    def _acc(self, rs: _RS) -> None:
+        with self._lk:
+            self._u["n"] += 1
+            self._u["pt"] += rs.pt
+            self._u["ct"] += rs.ct
+            if rs.rl:
+                self._rl = rs.rl
+    
+    @staticmethod
+    def _rlh(h) -> dict:
+        rl = {}
+        for k, v in h.items():
+            k = k.lower()
+            if k.startswith("x-ratelimit-"):
+                rl[k[12:]] = v
+            elif k == "retry-after":
+                rl[k] = v
+        return rl
+
+class _GB(_BE):
+    n = "groq"
+    
+    def __init__(self, tm: _TM):
+        super().__init__()
+        self._tm = tm
+    
+    def ready(self) -> bool:
+        return self._tm._cl is not None
+    
+    def chat(self, ms: list, m: str, **kw) -> _RS:
+        t0 = time.time()
+        raw = self._tm._cl.chat.completions.with_raw_response.create(messages=ms, model=m, **kw)
+        cc = raw.parse()
+        rs = _RS(cc.choices[0].message.content or "", m, self.n,
+                 lat=time.time() - t0, rl=self._rlh(raw.headers))
+        rs.tc = [{"id": t.id, "type": "function",
+                  "function": {"name": t.function.name, "arguments": t.function.arguments}}
+                 for t in cc.choices[0].message.tool_calls or []] or None
+        if cc.usage:
+            rs.pt, rs.ct = cc.usage.prompt_tokens, cc.usage.completion_tokens
+            pd = getattr(cc.usage, "prompt_tokens_details", None)
+            rs.cpt = getattr(pd, "cached_tokens", None)
+        self._acc(rs)
+        return rs
+    
+    def stream(self, ms: list, m: str, **kw) -> _SR:
+        raw = self._tm._cl.chat.completions.with_raw_response.create(
+            messages=ms, model=m, stream=True, **kw)
+        st = raw.parse()
+        
+        def g():
+            for ch in st:
+                u = ch.usage or (ch.x_groq.usage if ch.x_groq else None)
+                d = ch.choices[0].delta.content if ch.choices else None
+                yield d, (u.prompt_tokens, u.completion_tokens) if u else None
+        return _SR(self, g(), m, self._rlh(raw.headers), st.close)
+
+class _OB(_BE):
+    n = "local"
+    
+    def __init__(self, u: str, k: Optional[str] = None, ct: float = 30.0):
+        super().__init__()
+        self._ep = u.rstrip('/') + "/chat/completions"
+        self._k = k
+        self._ct = ct
+    
+    def _rq(self, bd: dict):
+        h = {"Content-Type": "application/json"}
+        if self._k:
+            h["Authorization"] = f"Bearer {self._k}"
+        rq = urllib.request.Request(self._ep, data=json.dumps(bd).encode(), headers=h)
+        try:
+            return urllib.request.urlopen(rq, timeout=self._ct)
+        except urllib.error.HTTPError as ex:
+            raise RuntimeError(f"{ex.code} {ex.read()[:300].decode('utf-8', 'replace')}") from None
+        except urllib.error.URLError as ex:
+            raise RuntimeError(f"{self._ep}: {ex.reason}") from None
+    
+    def chat(self, ms: list, m: str, **kw) -> _RS:
+        t0 = time.time()
+        with self._rq({"model": m, "messages": ms, **kw}) as rp:
+            d = json.load(rp)
+            rl = self._rlh(rp.headers)
+        rs = _RS(d["choices"][0]["message"].get("content") or "", m, self.n,
+                 lat=time.time() - t0, rl=rl, tc=d["choices"][0]["message"].get("tool_calls") or None)
+        u = d.get("usage") or {}
+        rs.pt, rs.ct = u.get("prompt_tokens", 0), u.get("completion_tokens", 0)
+        rs.cpt = (u.get("prompt_tokens_details") or {}).get("cached_tokens",
+                                                             (d.get("timings") or {}).get("cache_n"))
+        self._acc(rs)
+        return rs
+    
+    def stream(self, ms: list, m: str, **kw) -> _SR:
+        rp = self._rq({"model": m, "messages": ms, "stream": True,
+                       "stream_options": {"include_usage": True}, **kw})
+        
+        def g():
+            with rp:
+                for ln in rp:
+                    ln = ln.strip()
+                    if not ln.startswith(b"data:"):
+                        continue
+                    p = ln[5:].strip()
+                    if p == b"[DONE]":
+                        break
+                    d = json.loads(p)
+                    u = d.get("usage")
+                    ch = d.get("choices") or [{}]
+                    yield (ch[0].get("delta") or {}).get("content"), \
+                        (u["prompt_tokens"], u["completion_tokens"]) if u else None
+        return _SR(self, g(), m, self._rlh(rp.headers), rp.close)
+
+class _CW:
+    def __init__(self, p: str):
+        self._lk = threading.Lock()
+        self._rf = open(p, "ab")
+        if fcntl:
+            try:
+                fcntl.flock(self._rf, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise RuntimeError(f"{p} is being recorded by another process") from None
+        self._f = io.TextIOWrapper(gzip.GzipFile(fileobj=self._rf, mode="ab"), encoding="utf-8")
+        atexit.register(self.close)
+    
+    def close(self) -> None:
+        self._f.close()
+        self._rf.close()
+    
+    @staticmethod
+    def key(m: str, ms: list, kw: dict) -> str:
+        return hashlib.sha256(json.dumps([m, ms, kw], sort_keys=True).encode()).hexdigest()
+    
+    def put(self, m: str, ms: list, kw: dict, rs: _RS, ch: Optional[list] = None) -> None:
+        e = {"k": self.key(m, ms, kw), "ts": round(time.time(), 3), "b": rs.b, "m": m, "ms": ms, "kw": kw,
+             "t": rs.t, "pt": rs.pt, "ct": rs.ct, "cpt": rs.cpt, "lat": round(rs.lat, 4), "rl": rs.rl}
+        if ch is not None:
+            e["ch"] = ch
+        if rs.tc:
+            e["tc"] = rs.tc
+        with self._lk:
+            self._f.write(json.dumps(e, separators=(',', ':')) + "\n")
+            self._f.flush()
+
+class _RB(_BE):
+    def __init__(self, be: _BE, w: _CW):
+        super().__init__()
+        self.n = be.n
+        self._be = be
+        self._w = w
+    
+    def ready(self) -> bool:
+        return self._be.ready()
+    
+    def chat(self, ms: list, m: str, **kw) -> _RS:
+        rs = self._be.chat(ms, m, **kw)
+        self._acc(rs)
+        self._w.put(m, ms, kw, rs)
+        return rs
+    
+    def stream(self, ms: list, m: str, **kw) -> _SR:
+        sr = self._be.stream(ms, m, **kw)
+        
+        def g():
+            t0, ch = time.time(), []
+            for d in sr:
+                ch.append([round(time.time() - t0, 4), d])
+                yield d, None
+            yield None, (sr.rs.pt, sr.rs.ct)
+            self._w.put(m, ms, kw, sr.rs, ch)
+        return _SR(self, g(), m, sr.rs.rl, sr.close)
+
+class _PB(_BE):
+    def __init__(self, n: str, es: dict, sp: float):
+        super().__init__()
+        self.n = n
+        self._es = es
+        self._sp = sp
+    
+    @staticmethod
+    def load(p: str) -> dict:
+        es: dict = {"": deque()}
+        with gzip.open(p, "rt", encoding="utf-8") as f:
+            for ln in f:
+                if ln.strip():
+                    e = json.loads(ln)
+                    es.setdefault(e["k"], deque()).append(e)
+                    es[""].append(e)
+        return es
+    
+    def _nx(self, ms: list, m: str, kw: dict) -> dict:
+        with self._lk:
+            q = self._es.get(_CW.key(m, ms, kw))
+            if not q:
+                raise RuntimeError("request not in cassette (prompt, model or parameters differ from the recording)")
+            return q.popleft()
+    
+    def _wt(self, s: float) -> None:
+        if self._sp > 0 and s > 0:
+            time.sleep(s / self._sp)
+    
+    def chat(self, ms: list, m: str, **kw) -> _RS:
+        e = self._nx(ms, m, kw)
+        self._wt(e["lat"])
+        rs = _RS(e["t"], e["m"], self.n, e["pt"], e["ct"], e.get("cpt"), e["lat"], e.get("rl") or {}, e.get("tc"))
+        self._acc(rs)
+        return rs
+    
+    def stream(self, ms: list, m: str, **kw) -> _SR:
+        e = self._nx(ms, m, kw)
+        
+        def g():
+            pv = 0.0
+            for dt, d in e.get("ch") or [[e["lat"], e["t"]]]:
+                self._wt(dt - pv)
+                pv = dt
+                yield d, None
+            yield None, (e["pt"], e["ct"])
+        return _SR(self, g(), e["m"], e.get("rl") or {})
+
+class _CE(Exception):
+    pass
+
+class _SF:
+    def __init__(self):
+        self._lk = threading.Lock()
+        self._p: dict = {}
+    
+    @staticmethod
+    def key(b: str, m: str, ms: list, kw: dict) -> str:
+        nm = [{**x, "content": re.sub(r'[ \t]+\n', '\n', (x.get("content") or "").replace("\r\n", "\n")).strip()}
+              for x in ms]
+        return _CW.key(f"{b}/{m}", nm, kw)
+    
+    def do(self, k: str, fn: Callable) -> Tuple[object, bool]:
+        with self._lk:
+            f = self._p.get(k)
+            ld = f is None
+            if ld:
+                f = self._p[k] = Future()
+        if not ld:
+            return f.result(), True
+        try:
+            f.set_result(fn())
+        except Exception as ex:
+            f.set_exception(ex)
+            raise
+        except BaseException:
+            f.set_exception(RuntimeError("shared request was cancelled"))
+            raise
+        finally:
+            with self._lk:
+                self._p.pop(k, None)
+        return f.result(), False
+
+class _MR:
+    _EO = {"chat": 400, "create": 2048, "edit": 2048, "agent": 400, "codemod": 400}
+    
+    def __init__(self, cfg: Config, wn: int = 20):
+        self._cfg = cfg
+        self._lk = threading.Lock()
+        self._wn = wn
+        self._w: dict[str, deque] = {}
+        self._th = cfg._rth
+    
+    @staticmethod
+    def est(s: str) -> int:
+        return max(1, len(s) // 4)
+    
+    def pick(self, cmd: str, pr: str) -> str:
+        if cmd in self._cfg._pin:
+            return self._cfg._pin[cmd]
+        pt = self.est(pr)
+        eo = self._EO.get(cmd, pt if cmd == "modify" else 400)
+        return self._cfg._fdm if pt + eo <= self._th else self._cfg._dm
+    
+    def rec(self, m: str, lat: float, ok: bool) -> None:
+        with self._lk:
+            self._w.setdefault(m, deque(maxlen=self._wn)).append((lat, ok))
+            self._adj()
+    
+    def _st(self, m: str) -> Tuple[int, float, float]:
+        w = self._w.get(m) or ()
+        if not w:
+            return 0, 0.0, 0.0
+        ls = [l for l, o in w if o]
+        return len(w), sum(1 for _, o in w if not o) / len(w), sum(ls) / len(ls) if ls else 0.0
+    
+    def _adj(self) -> None:
+        bt = self._cfg._rth
+        nf, ef, lf = self._st(self._cfg._fdm)
+        nb, eb, lb = self._st(self._cfg._dm)
+        if nf >= 5 and ef > 0.2:
+            self._th = max(bt // 4, int(self._th * 0.75))
+        elif nb >= 5 and (eb > 0.2 or lb > self._cfg._rsl) and ef <= 0.1:
+            self._th = min(bt * 4, int(self._th * 1.25))
+        else:
+            self._th += (bt - self._th) // 10
+    
+    def stats(self) -> dict:
+        with self._lk:
+            return {"threshold": self._th,
+                    **{m: self._st(m) for m in self._w}}
+
+class _PT:
+    SYS = """Expert AI code assistant and code generator.
+Write complete, production-quality code with proper error handling.
+Follow the instructions in the last message exactly."""
+    _T = {
+        "ctx": Template("File context ($fp):\n$ct"),
+        "chat": Template("""INSTRUCTIONS:
+1. Clear, concise, accurate responses
+2. Complete, production-ready code
+3. Proper error handling
+4. Explain changes when modifying
+5. Be helpful and educational
+
+User request: $ui
+
+Response:"""),
+        "create": Template("""Create production-quality code.
+
+CRITICAL: Output ONLY code - no markdown, no fences, no explanations.
+
+Target: $fn
+Request: $d
+
+Generate complete code:"""),
+        "modify": Template("""Modify the code from the file context based on request.
+
+CRITICAL: Output ONLY complete modified code - no markdown, no fences, no explanations.
+
+Target: $fn
+Modification: $d
+
+Generate complete modified code:"""),
+        "region": Template("""Modify ONLY the code region below based on request.
+
+CRITICAL: Output ONLY the complete modified region - no markdown, no fences, no explanations.
+Keep its name and signature unless the request changes them.
+
+Target: $fn (lines $s-$e)
+Region:
+$rg
+Modification: $d
+
+Generate the modified region:"""),
+        "keep": Template("Lines marked __aicode_N__ stand for unchanged code omitted to save space; "
+                         "copy every marker line exactly as it is."),
+        "outline": Template("""Write the outline of a Python module.
+
+CRITICAL: Output ONLY code - no markdown, no fences, no explanations.
+Include every import, constant and class, and every function/method signature with a docstring.
+Leave each function body as ... (bodies are written separately).
+
+Target: $fn
+Request: $d
+
+Generate the outline:"""),
+        "fill": Template("""Implement $q from the outline above.
+
+CRITICAL: Output ONLY the complete function (decorators, signature, docstring, body) - no markdown, no fences, no explanations.
+Keep the signature and use only names the outline defines or imports.
+
+Target: $fn
+Function:
+$rg
+Module purpose: $d
+
+Generate the function:"""),
+        "sigs": Template("Surrounding signatures of $fn (reference only, do not output):\n$cx"),
+        "agent": Template("""Answer the request about the project in the current directory.
+Use the tools to read only the code you need (grep, find_symbol, list_dir, read_file line
+ranges); do not guess file contents. Current file: $fp
+
+User request: $ui
+
+Response:"""),
+        "edit": Template("""Apply the request to the project files.
+
+CRITICAL: Reply with ONE JSON object only, matching:
+{"files": [{"path": "relative/path", "action": "create" | "modify" | "delete",
+            "content": "complete new file text"}  or  {..., "patch": "unified diff hunks starting with @@"}],
+ "notes": "one-line summary"}
+Use "patch" for small changes to large files and "content" otherwise. List only files that change.
+
+Request: $d
+
+JSON:"""),
+        "codemod": Template("""Plan a mechanical change to apply locally to every file matching $gl.
+
+CRITICAL: Reply with ONE JSON object only, matching:
+{"rules": [{"find": "Python regex (re.M)", "replace": "replacement, \\\\1 for groups"}],
+ "renames": {"old_identifier": "new_identifier"},
+ "notes": "one-line summary"}
+Rules run in order on the whole file text, then renames (code identifiers only, not strings or
+comments). Use the narrowest patterns that make the change; sample files are above.
+
+Request: $d
+
+JSON:"""),
+        "rejson": Template("""Your reply was rejected: $em
+Reply again with ONE JSON object matching the schema above and nothing else."""),
+        "summ": Template("""Summarize this file for a code reviewer: purpose, main classes and functions
+(with signatures), dependencies, and notable bugs or risks. Be concise; plain text.
+
+Target: $fn
+
+Summary:"""),
+        "merge": Template("""Combine these file summaries into one shorter summary. Keep details relevant
+to the question; keep file names.
+
+Question: $q
+
+Summaries:
+$ss
+
+Combined summary:"""),
+        "review": Template("""Answer the question about the files using the summaries below.
+Reference file names; be specific and actionable.
+
+Question: $q
+
+Summaries:
+$ss
+
+Answer:"""),
+        "repair": Template("""The code below failed automated checks.
+
+CRITICAL: Output ONLY the complete corrected code - no markdown, no fences, no explanations.
+
+Target: $fn
+Errors:
+$es
+
+Code:
+$ct
+
+Generate complete corrected code:"""),
+    }
+    
+    @classmethod
+    @_pf.wrap("build")
+    def build(cls, k: str, cx: Optional[str] = None, **kw) -> list:
+        ms = [{"role": "system", "content": cls.SYS}]
+        if cx:
+            ms.append({"role": "user", "content": cx})
+        ms.append({"role": "user", "content": cls._T[k].substitute(**kw)})
+        return ms
+    
+    @classmethod
+    @_pf.wrap("build")
+    def ctx(cls, fp: str, ct: str, mx: Optional[int] = None) -> str:
+        if mx and len(ct) > mx:
+            ct = ct[:mx] + "\n... (truncated)"
+        return cls._T["ctx"].substitute(fp=fp, ct=ct)
+    
+    @classmethod
+    def sigs(cls, fn: str, cx: str) -> str:
+        return cls._T["sigs"].substitute(fn=fn, cx=cx)
+    
+    @staticmethod
+    def flat(ms: list) -> str:
+        return ''.join(f"{x['role']}\x00{x.get('content') or ''}"
+                       f"{json.dumps(x['tool_calls']) if x.get('tool_calls') else ''}\x01" for x in ms)
+    
+    @classmethod
+    def key(cls, m: str, ms: list) -> str:
+        return hashlib.sha256(f"{m}\x02{cls.flat(ms)}".encode()).hexdigest()
+
 class _AI:
-    def __init__(self, tm: _TM, cfg: Config, c: Console):
+    def __init__(self, tm: _TM, cfg: Config, c: Console, ss: _SS):
         self._tm = tm
         self._cfg = cfg
         self._c = c
+        self._ss = ss
+        self._ld = _LD(c, cfg)
+        self._pc: Optional[Callable[[], bool]] = None
+        self._pk = threading.Lock()
+        self._cv = threading.Event()
+        self._os: set = set()
+        self._bs: dict[str, _BE] = {
+            "groq": _GB(tm),
+            "local": _OB(cfg._lu, os.getenv("AICODE_LOCAL_KEY"), cfg._ct),
+        }
+        if cfg._rpf:
+            es = _PB.load(cfg._rpf)
+            self._bs = {n: _PB(n, es, cfg._rps) for n in self._bs}
+            c.print(f"[blue]Replaying {len(es[''])} responses from {cfg._rpf}[/blue]")
+        elif cfg._rcf:
+            try:
+                w = _CW(cfg._rcf)
+            except (RuntimeError, OSError) as ex:
+                c.print(f"[red]Record failed: {ex}[/red]")
+                sys.exit(1)
+            self._bs = {n: _RB(b, w) for n, b in self._bs.items()}
+            c.print(f"[blue]Recording to {cfg._rcf}[/blue]")
+        self._mr = _MR(cfg)
+        self._sf = _SF()
+        self._cx = 0.0
+        self._lp: dict = {}
+        for m, lat, ok in ss.recent():
+            self._mr.rec(m, lat, bool(ok))
+        self._lm: Optional[str] = None
+    
+    def used(self) -> set:
+        return {self._cfg._bk} | set(self._cfg._rr.values())
+    
+    def backend(self, cmd: str = "chat") -> _BE:
+        return self._bs.get(self._cfg._rr.get(cmd, self._cfg._bk), self._bs["groq"])
+    
+    def _mdl(self, b: _BE, cmd: str, pr: str) -> str:
+        if b.n == "local":
+            return self._cfg._pin.get(cmd, self._cfg._lmd)
+        return self._mr.pick(cmd, pr)
+    
+    def _ru(self, b: _BE, m: str, ms: list, rs: _RS) -> str:
+        fl = _PT.flat(ms)
+        with b._lk:
+            lp, self._lp[(b.n, m)] = self._lp.get((b.n, m), ""), fl
+        if rs.cpt is not None:
+            return f" | reused {rs.cpt}, new {rs.pt - rs.cpt}"
+        ru = min(rs.pt, len(os.path.commonprefix([lp, fl])) // 4)
+        return f" | reused ~{ru}, new ~{rs.pt - ru}"
+    
+    def _get(self, b: _BE, ms: list, m: str, kw: dict, pg: list) -> _RS:
+        if self._cv.is_set():
+            raise _CE()
+        if "tools" in kw or "response_format" in kw:
+            return b.chat(ms, m, **kw)
+        sr = b.stream(ms, m, **kw)
+        with self._pk:
+            self._os.add(sr)
+        try:
+            if self._cv.is_set():
+                raise _CE()
+            for d in sr:
+                pg[0] += len(d)
+                if self._cv.is_set():
+                    raise _CE()
+            return sr.rs
+        finally:
+            with self._pk:
+                self._os.discard(sr)
+            if self._cv.is_set():
+                sr.close()
+    
+    def cancel(self) -> None:
+        self._cv.set()
+        self._cx = time.time()
+        with self._pk:
+            ss = list(self._os)
+        for sr in ss:
+            sr.close()
+    
+    @contextmanager
+    def pool(self, n: int) -> Iterator[ThreadPoolExecutor]:
+        if threading.current_thread() is threading.main_thread():
+            self._cv.clear()
+        ex = ThreadPoolExecutor(max_workers=max(1, n))
+        try:
+            yield ex
+        except KeyboardInterrupt:
+            self.cancel()
+            _sdn(ex)
+            raise _CE() from None
+        finally:
+            ex.shutdown(wait=not self._cv.is_set())
+    
+    def _wt(self, b: _BE, ms: list, m: str, kw: dict) -> _RS:
+        pg, bx = [0], {}
+        if threading.current_thread() is not threading.main_thread():
+            return self._get(b, ms, m, kw, pg)
+        self._cv.clear()
+        
+        def wk():
+            try:
+                bx["rs"] = self._get(b, ms, m, kw, pg)
+            except BaseException as ex:
+                bx["ex"] = ex
+        th = threading.Thread(target=wk, daemon=True)
+        t0 = time.time()
+        sp = self._c.status(f"Waiting for {m}...") if self._c.is_terminal and not self._cfg._pl else None
+        try:
+            with sp or nullcontext():
+                th.start()
+                while th.is_alive():
+                    th.join(0.1)
+                    if sp:
+                        sp.update(f"{m}: {time.time() - t0:.1f}s, ~{pg[0] // 4} tokens (Ctrl-C to cancel)")
+        except KeyboardInterrupt:
+            self.cancel()
+            raise _CE() from None
+        if "ex" in bx:
+            raise bx["ex"]
+        return bx["rs"]
+    
+    def model(self, cmd: str, pr: str) -> str:
+        return self._mdl(self.backend(cmd), cmd, pr)
+    
+    @contextmanager
+    def charged(self, fn: Callable[[], bool]) -> Iterator[None]:
+        self._pc = fn
+        try:
+            yield
+        finally:
+            self._pc = None
+    
+    def query(self, pr, m: str = None, cmd: str = "chat", fp: Optional[str] = None,
+              qt: bool = False, js: bool = False) -> Optional[str]:
+        rs = self.call(pr, m, cmd, fp, qt, js)
+        return rs.t if rs else None
     
-    def query(self, pr: str, m: str = None) -> Optional[str]:
-        if not self._tm._cl:
+    def call(self, pr, m: str = None, cmd: str = "chat", fp: Optional[str] = None,
+             qt: bool = False, js: bool = False, **xk) -> Optional[_RS]:
+        ms = [{"role": "user", "content": pr}] if isinstance(pr, str) else pr
+        b = self.backend(cmd)
+        if not b.ready():
             self._c.print("[red]No client[/red]")
             return None
-        m = m or self._cfg._dm
-        try:
-            cc = self._tm._cl.chat.completions.create(
-                messages=[{"role": "user", "content": pr}],
-                model=m,
-                temperature=0.7,
-                max_tokens=2048,
-            )
-            r = cc.choices[0].message.content
-            if cc.usage:
-                u = cc.usage
-                self._c.print(f"[blue]Tokens: P={u.prompt_tokens}, C={u.completion_tokens}, T={u.total_tokens}[/blue]")
-            return r
+        m = m or self._mdl(b, cmd, ''.join(x.get("content") or "" for x in ms))
+        self._lm = m
+        ck = _PT.key(m, ms) if self._cfg._rc and not xk else None
+        if ck:
+            ch = self._ss.cget(ck)
+            if ch is not None:
+                self._c.print(f"[blue]Cache hit ({m})[/blue]")
+                return _RS(ch, m, b.n)
+        if not self._ld.allow(cmd):
+            return None
+        with self._pk:
+            pc, self._pc = self._pc, None
+        if pc and not pc():
+            return None
+        kw = {"temperature": 0.7, "max_tokens": 4096 if js else 2048, **xk}
+        if js:
+            kw["response_format"] = {"type": "json_object"}
+        t0 = time.time()
+        try:
+            with _pf.ph("api"):
+                rs, sh = self._sf.do(_SF.key(b.n, m, ms, kw), lambda: self._wt(b, ms, m, kw))
+            if sh:
+                if not qt:
+                    self._c.print(f"[blue]Shared an identical in-flight request ({m})[/blue]")
+                return rs
+            self._mr.rec(m, rs.lat, True)
+            self._ss.metric(cmd, rs, True)
+            self._ld.add(cmd, fp, rs, self._tm._at)
+            if b.n == "groq":
+                self._ss.key_used(self._tm._at, True)
+            if (rs.pt or rs.ct) and not qt:
+                self._c.print(f"[blue]Tokens: P={rs.pt}, C={rs.ct}, T={rs.pt + rs.ct} ({m})"
+                              f"{self._ru(b, m, ms, rs)}[/blue]")
+            if ck:
+                self._ss.cput(ck, rs.t)
+            return rs
+        except _CE:
+            self._mr.rec(m, time.time() - t0, False)
+            if threading.current_thread() is threading.main_thread():
+                self._c.print("[yellow]Request cancelled[/yellow]")
+            return None
         except Exception as ex:
-            self._c.print(f"[red]API error: {ex}[/red]")
+            self._mr.rec(m, time.time() - t0, False)
+            self._ss.metric(cmd, _RS("", m, b.n, lat=time.time() - t0), False)
+            if b.n == "groq":
+                self._ss.key_used(self._tm._at, False)
+            self._c.print(f"[red]API error ({b.n}): {ex}[/red]")
+            return None
+
+class _JB:
+    def __init__(self, p: Path):
+        self.p = p
+        self.n = p.stem
+        self.us: list[str] = []
+        self.rs: dict[str, str] = {}
+        self.st: dict[int, bool] = {}
+        self.cu: Optional[int] = None
+        self._lk = threading.Lock()
+    
+    @classmethod
+    def new(cls, d: Path, n: str, src: str, us: list) -> '_JB':
+        d.mkdir(exist_ok=True)
+        jb = cls(d / f"{n}.jsonl")
+        jb.us = us
+        jb._log({"job": n, "src": src, "ts": round(time.time(), 3), "units": us})
+        return jb
+    
+    @classmethod
+    def open(cls, d: Path, n: str) -> Optional['_JB']:
+        p = d / f"{n}.jsonl"
+        if not p.exists():
             return None
+        jb = cls(p)
+        with open(p, "r", encoding="utf-8") as f:
+            for ln in f:
+                try:
+                    e = json.loads(ln)
+                except ValueError:
+                    continue
+                if "units" in e:
+                    jb.us = e["units"]
+                elif "h" in e:
+                    jb.rs[e["h"]] = e["r"]
+                elif "ok" in e:
+                    jb.st[e["i"]] = e["ok"]
+        return jb
+    
+    def lock(self) -> bool:
+        self._lf = open(self.p, "a")
+        if fcntl:
+            try:
+                fcntl.flock(self._lf, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._lf.close()
+                return False
+        return True
+    
+    def unlock(self) -> None:
+        self._lf.close()
+    
+    def _log(self, e: dict) -> None:
+        with self._lk:
+            with open(self.p, "a", encoding="utf-8") as f:
+                f.write(json.dumps(e, separators=(',', ':')) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+    
+    def key(self, pr, cmd: str) -> str:
+        ms = [{"role": "user", "content": pr}] if isinstance(pr, str) else pr
+        u = self.us[self.cu] if self.cu is not None and self.cu < len(self.us) else ""
+        return _PT.key(f"{self.cu}\x00{u}\x00{cmd}", ms[-1:])
+    
+    def put(self, h: str, r: str) -> None:
+        self.rs[h] = r
+        self._log({"i": self.cu, "h": h, "r": r})
+    
+    def done(self, i: int, ok: bool) -> None:
+        self.st[i] = ok
+        self._log({"i": i, "ok": ok})
+    
+    def todo(self) -> list:
+        return [i for i in range(len(self.us)) if not self.st.get(i)]
+
+class _AG:
+    _MX = 8000
+    _TS = [
+        {"type": "function", "function": {
+            "name": "read_file", "description": "Read a line range of a project file (1-based, inclusive)",
+            "parameters": {"type": "object", "properties": {
+                "path": {"type": "string"}, "start": {"type": "integer"}, "end": {"type": "integer"}},
+                "required": ["path"]}}},
+        {"type": "function", "function": {
+            "name": "grep", "description": "Search files for a regular expression; path may be a dir or glob",
+            "parameters": {"type": "object", "properties": {
+                "pattern": {"type": "string"}, "path": {"type": "string"}},
+                "required": ["pattern"]}}},
+        {"type": "function", "function": {
+            "name": "list_dir", "description": "List a project directory",
+            "parameters": {"type": "object", "properties": {"path": {"type": "string"}}}}},
+        {"type": "function", "function": {
+            "name": "find_symbol", "description": "Find where a Python function or class (e.g. Foo.bar) is defined",
+            "parameters": {"type": "object", "properties": {
+                "name": {"type": "string"}, "path": {"type": "string"}},
+                "required": ["name"]}}},
+    ]
+    
+    def __init__(self, app: 'AicodeApp'):
+        self._a = app
+        self._tf = {"read_file": self._rf, "grep": self._gr, "list_dir": self._ls, "find_symbol": self._fy}
+    
+    def _ok(self, fp: str) -> None:
+        ok, em = self._a._fm._isp(fp)
+        if not ok:
+            raise ValueError(em)
+        if self._a._fm._ign(fp):
+            raise ValueError("hidden or ignored path")
+    
+    def _rf(self, path: str, start: int = 1, end: Optional[int] = None) -> str:
+        self._ok(path)
+        ok, em = self._a._fm._cfs(path)
+        if not ok:
+            raise ValueError(em)
+        ls = Path(path).read_text(encoding="utf-8").splitlines()
+        s = max(1, int(start))
+        e = min(len(ls), int(end) if end else len(ls), s + 399)
+        return f"{path} (lines {s}-{e} of {len(ls)})\n" + "\n".join(f"{i:>5}| {ls[i - 1]}" for i in range(s, e + 1))
+    
+    def _gr(self, pattern: str, path: str = ".") -> str:
+        self._ok(path)
+        rx, out = re.compile(pattern), []
+        for fp in self._a._fm._xp(path):
+            if Path(fp).name.startswith("."):
+                continue
+            try:
+                with open(fp, encoding="utf-8") as f:
+                    for i, ln in enumerate(f, 1):
+                        if rx.search(ln):
+                            out.append(f"{fp}:{i}: {ln.rstrip()[:200]}")
+                            if len(out) >= 100:
+                                return "\n".join(out) + "\n... (more matches)"
+            except (OSError, UnicodeDecodeError):
+                continue
+        return "\n".join(out) or "no matches"
+    
+    def _ls(self, path: str = ".") -> str:
+        self._ok(path)
+        es = sorted((e for e in os.scandir(path) if not e.name.startswith(".")
+                     and not self._a._fm._ign(os.path.join(path, e.name))), key=lambda e: e.name)
+        return "\n".join(e.name + ("/" if e.is_dir() else "") for e in es[:300]) or "empty"
+    
+    def _fy(self, name: str, path: str = ".") -> str:
+        self._ok(path)
+        out = []
+        for fp in self._a._fm._xp(path):
+            if not fp.endswith(".py") or Path(fp).name.startswith("."):
+                continue
+            try:
+                src = Path(fp).read_text(encoding="utf-8")
+                ds = _TG._defs(ast.parse(src))
+            except (OSError, UnicodeDecodeError, SyntaxError, ValueError):
+                continue
+            ls = src.splitlines()
+            for q, n, par in ds:
+                if q == name or q.endswith("." + name):
+                    s, e = _TG._span(n)
+                    out.append(f"{fp}:{s + 1}-{e} {_TG._sig(ls, n).strip().splitlines()[-1]}")
+        return "\n".join(out[:50]) or "not found"
+    
+    def _run(self, tc: dict) -> str:
+        f = tc.get("function") or {}
+        fn = self._tf.get(f.get("name"))
+        try:
+            if not fn:
+                raise ValueError(f"unknown tool {f.get('name')}")
+            a = json.loads(f.get("arguments") or "{}")
+            r = fn(**a) if isinstance(a, dict) else fn()
+        except (TypeError, ValueError, OSError, re.error) as ex:
+            r = f"error: {ex}"
+        return r if len(r) <= self._MX else r[:self._MX] + "\n... (truncated)"
+    
+    def run(self, ui: str) -> Optional[str]:
+        a = self._a
+        with a._ai.charged(a._lm.use_prompt):
+            return self._loop(ui)
+    
+    def _loop(self, ui: str) -> Optional[str]:
+        a, cfg = self._a, self._a._cfg
+        ms = _PT.build("agent", None, ui=ui, fp=a._fm._cp or "none")
+        tk = 0
+        for i in range(cfg._ags + 1):
+            fin = i == cfg._ags or tk >= cfg._agt
+            rs = a._ai.call(ms, cmd="agent", fp=a._fm._cp, qt=True, tools=self._TS,
+                            tool_choice="none" if fin else "auto")
+            if not rs:
+                return None
+            tk += rs.pt + rs.ct
+            if not rs.tc or fin:
+                a._c.print(f"[blue]Agent: {i} tool rounds, {tk} tokens ({rs.m})[/blue]")
+                return rs.t or None
+            ms.append({"role": "assistant", "content": rs.t or None, "tool_calls": rs.tc})
+            a._c.print(Text(', '.join(f"{(t.get('function') or {}).get('name')}"
+                                      f"({(t.get('function') or {}).get('arguments', '')[:60]})"
+                                      for t in rs.tc), style="blue"))
+            with _pf.ph("tools"):
+                if len(rs.tc) > 1:
+                    with ThreadPoolExecutor(max_workers=min(8, len(rs.tc))) as ex:
+                        out = list(ex.map(self._run, rs.tc))
+                else:
+                    out = [self._run(rs.tc[0])]
+            for t, r in zip(rs.tc, out):
+                ms.append({"role": "tool", "tool_call_id": t.get("id"), "content": r})
+        return None
 
 class _CP:
     def __init__(self, app: 'AicodeApp'):
@@ -410,6 +2694,19 @@ class _CP:
             "modify": self._cmo,
             "reset": self._cr,
             "gettoken": self._cgt,
+            "backend": self._cbk,
+            "models": self._cmd,
+            "pin": self._cpn,
+            "history": self._chi,
+            "usage": self._cus,
+            "review": self._crv,
+            "batch": self._cba,
+            "resume": self._cre,
+            "jobs": self._cjs,
+            "profile": self._cpf,
+            "edit": self._ced,
+            "agent": self._cag,
+            "codemod": self._ccm,
         }
     
     def process(self, cmd: str) -> bool:
@@ -418,14 +2715,14 @@ class _CP:
             return False
         c = pts[0].lower()
         if c in self._cm:
-            return self._cm[c](*pts[1:])
+            return self._cm[c](*pts[1:]) is not False
         return False
     
     def _cl(self, fp: str = None, *args) -> bool:
         if not self._a._lm.check_licensed():
             self._a._c.print("[red]License required for file commands[/red]")
             self._a._c.print("[cyan]Contact: https://www.facebook.com/share/178Nt8BnuP/[/cyan]")
-            return True
+            return False
         if not fp:
             fp = Prompt.ask("[yellow]Filepath[/yellow]").strip()
         if fp:
@@ -435,13 +2732,13 @@ class _CP:
     def _cs(self, fp: Optional[str] = None, *args) -> bool:
         if not self._a._lm.check_licensed():
             self._a._c.print("[red]License required for file commands[/red]")
-            return True
-        return self._a._fm.save(filepath=fp)
+            return False
+        return self._a._fm.save(fp=fp)
     
     def _cc(self, *args) -> bool:
         if not self._a._lm.check_licensed():
             self._a._c.print("[red]License required for file commands[/red]")
-            return True
+            return False
         self._a._fm.clear()
         return True
     
@@ -452,13 +2749,31 @@ class _CP:
   exit                         - Exit application
   addapikeys [<key>]           - Add Groq API key
   gettoken                     - Get license info
+  backend [<cmd> <name>]       - Show backends / route a command (groq, local)
+  models                       - Show model routing and latency stats
+  pin <cmd> [<model>]          - Pin a model for a command (no model = unpin)
+  history [<n>]                - Show recent requests
+  usage [--by file|command|model|day|key] [--days N]
+                               - Token and cost totals from the ledger
+  profile [on|off]             - Profile each command (CPU, memory, phases)
+  agent [on|off]               - Chat lets the model read/grep project files via tools
 
 [bold yellow]Licensed Features (requires 5-day license):[/bold yellow]
-  load <filepath>              - Load file
+  load <filepath|glob>         - Load file (extra glob matches become context)
   save [<filepath>]            - Save file
   clear                        - Clear context
-  create <file> <desc...>      - Create new file
-  modify <file> <desc...>      - Modify existing file
+  create <file[,file...]> <desc...>
+                               - Create new file(s)
+  modify <file|glob[,...]> <desc...>
+                               - Modify existing file(s), e.g. "src/**/*.py"
+  modify <file>::<Class.func|10-40> <desc...>
+                               - Modify only one function/class/line range
+  edit <desc...>               - Multi-file edit as structured JSON (uses loaded files)
+  review <dir|glob> <question> - Ask about many files (cached summaries)
+  batch <jobfile> [<name>]     - Run create/modify lines from a file, checkpointed
+  resume <name>                - Continue an interrupted batch job
+  jobs                         - List batch jobs and progress
+  codemod <glob> <desc...>     - One request plans a regex/rename; applied locally
 
 [bold cyan]Free Features:[/bold cyan]
   • Chat with AI (5 free prompts)
@@ -475,7 +2790,22 @@ class _CP:
   Contact: https://www.facebook.com/share/178Nt8BnuP/
   Telegram: t.me/JadXHex
         """
-        self._a._c.print(Panel(ht.strip(), title="[bold]Aicode Help[/bold]", padding=(1, 2)))
+        self._a._pn(ht.strip(), "[bold]Aicode Help[/bold]")
+        return True
+    
+    def _cag(self, st: str = None, *args) -> bool:
+        cfg = self._a._cfg
+        if st and st.lower() in ("on", "off"):
+            cfg._ag = st.lower() == "on"
+        self._a._c.print(f"[blue]Agent mode {'on' if cfg._ag else 'off'}"
+                         f" (max {cfg._ags} tool rounds, {cfg._agt} tokens per turn)[/blue]")
+        return True
+    
+    def _cpf(self, st: str = None, *args) -> bool:
+        if st and st.lower() in ("on", "off"):
+            _pf.on = st.lower() == "on"
+        self._a._c.print(f"[blue]Profiling {'on' if _pf.on else 'off'}"
+                         f"{f' (reports in {_pf.d})' if _pf.on else ''}[/blue]")
         return True
     
     def _ce(self, *args) -> bool:
@@ -520,17 +2850,596 @@ class _CP:
         self._a._c.print("[cyan]Telegram: t.me/JadXHex[/cyan]")
         return True
 
+    def _cbk(self, *args) -> bool:
+        cfg = self._a._cfg
+        if len(args) >= 2:
+            cmd, bn = args[0].lower(), args[1].lower()
+            if bn not in _BKS:
+                self._a._c.print(f"[red]Unknown backend: {bn}[/red]")
+                return True
+            if cmd == "default":
+                cfg._bk = bn
+            else:
+                cfg._rr[cmd] = bn
+            if bn == "groq" and not self._a._tm._cl:
+                if not self._a._tm._at:
+                    self._a._tm.prompt_for_token()
+                self._a._tm.initialize_client()
+            self._a._c.print(f"[green]Route: {cmd} -> {bn}[/green]")
+            return True
+        for n, b in self._a._ai._bs.items():
+            u = b.usage()
+            rt = ', '.join(k for k, v in cfg._rr.items() if v == n)
+            ds = " (default)" if n == cfg._bk else ""
+            self._a._c.print(f"[cyan]{n}{ds}: ready={b.ready()} calls={u['n']} P={u['pt']} C={u['ct']}"
+                             f"{' routes=' + rt if rt else ''}[/cyan]")
+            rl = b.limits()
+            if rl:
+                self._a._c.print(f"[blue]  limits: {', '.join(f'{k}={v}' for k, v in rl.items())}[/blue]")
+        return True
+
+    def _cmd(self, *args) -> bool:
+        cfg = self._a._cfg
+        st = self._a._ai._mr.stats()
+        self._a._c.print(f"[cyan]fast={cfg._fdm} big={cfg._dm} threshold={st.pop('threshold')} tokens[/cyan]")
+        for m, (n, er, lt) in st.items():
+            self._a._c.print(f"[blue]  {m}: calls={n} errors={er:.0%} latency={lt:.2f}s[/blue]")
+        for k, v in cfg._pin.items():
+            self._a._c.print(f"[blue]  pinned: {k} -> {v}[/blue]")
+        return True
+
+    def _cpn(self, cmd: str = None, m: str = None, *args) -> bool:
+        if not cmd:
+            self._a._c.print("[red]Usage: pin <cmd> [<model>][/red]")
+            return True
+        cmd = cmd.lower()
+        if m:
+            self._a._cfg._pin[cmd] = m
+            self._a._c.print(f"[green]Pinned: {cmd} -> {m}[/green]")
+        else:
+            self._a._cfg._pin.pop(cmd, None)
+            self._a._c.print(f"[green]Unpinned: {cmd}[/green]")
+        return True
+
+    def _chi(self, n: str = "10", *args) -> bool:
+        try:
+            hs = self._a._ss.hlast(max(1, int(n)))
+        except ValueError:
+            self._a._c.print("[red]Usage: history [<n>][/red]")
+            return True
+        for ts, cmd, fp, pr, r in hs:
+            st = time.strftime("%Y-%m-%d %H:%M", time.localtime(ts))
+            self._a._c.print(f"[cyan]{st} {cmd}{' ' + escape(fp) if fp else ''}:[/cyan] {escape(pr[:100])}")
+        return True
+
+    def _vr(self, fn: str, r: str, cmd: str, rw: bool = False) -> Optional[str]:
+        cfg = self._a._cfg
+        if not cfg._vl:
+            return r
+        for i in range(cfg._vrn + 1):
+            cc = r if rw else self._a._fm._ecfr(r)
+            ok, es = self._a._vp.run(fn, cc)
+            if ok:
+                return r
+            self._a._c.print("[yellow]Validation failed:[/yellow]")
+            self._a._c.print(Text(es[:1500], style="red"))
+            if i == cfg._vrn:
+                break
+            self._a._c.print(f"[blue]Repair attempt {i + 1}/{cfg._vrn}[/blue]")
+            nr = self._a.make_query(_PT.build("repair", fn=fn, es=es[:3000], ct=cc), cmd, fn)
+            if not nr:
+                break
+            r = self._a._fm._ecfr(nr) if rw else nr
+        if self._a._cf("[yellow]Checks still failing. Keep result anyway?[/yellow]", False, False):
+            return r
+        return None
+
+    def _jfs(self, d: dict, sn: Optional[set] = None) -> Tuple[Optional[list], str]:
+        fm, out = self._a._fm, []
+        for f in d["files"]:
+            fp = os.path.normpath(f["path"].strip())
+            ok, em = fm._vfn(Path(fp).name)
+            if ok:
+                ok, em = fm._isp(fp)
+            if not ok:
+                return None, f"{fp}: {em}"
+            p, a = Path(fp), f["action"]
+            if a != "create" and not p.is_file():
+                return None, f"{fp}: cannot {a} a file that does not exist"
+            if sn is not None and a != "delete" and p.exists() and str(p.resolve()) not in sn:
+                return None, f"{fp}: only part of this file was shown, so it cannot be rewritten or patched here"
+            if str(p.resolve()) not in fm._fs:
+                fm.mark(fp)
+            if a == "delete":
+                out.append((fp, a, None))
+                continue
+            ct = f.get("content")
+            if ct is None:
+                try:
+                    ct = _apd(p.read_text(encoding="utf-8"), f["patch"])
+                except (OSError, UnicodeDecodeError) as ex:
+                    return None, f"{fp}: {ex}"
+                if ct is None:
+                    return None, f"{fp}: patch does not apply to the current file"
+            out.append((fp, a, ct))
+        return out, ""
+    
+    def _sj(self, pr: list, cmd: str, fp: Optional[str] = None,
+            sn: Optional[set] = None) -> Optional[Tuple[dict, list]]:
+        for i in range(2):
+            r = self._a.make_query(pr, cmd, fp, js=True)
+            if not r:
+                return None
+            d, em = _jed(r)
+            es = None
+            if d:
+                es, em = self._jfs(d, sn)
+            if es is not None:
+                return d, es
+            self._a._c.print(f"[yellow]Invalid structured response: {em}[/yellow]")
+            pr = pr + [{"role": "assistant", "content": r},
+                       {"role": "user", "content": _PT._T["rejson"].substitute(em=em)}]
+        return None
+    
+    def _sjf(self, fn: str, d: str, cx: Optional[str], cmd: str) -> Optional[str]:
+        jr = self._sj(_PT.build("edit", cx, d=f"{d}\nOnly change {fn}."), cmd, fn)
+        if not jr:
+            return None
+        for fp, a, ct in jr[1]:
+            if fp == os.path.normpath(fn) and ct is not None:
+                return ct
+        self._a._c.print(f"[red]Response has no content for {fn}[/red]")
+        return None
+    
+    def _ced(self, *dp) -> bool:
+        if not self._a._lm.check_licensed():
+            self._a._c.print("[red]License required for edit command[/red]")
+            return False
+        d = ' '.join(dp) or Prompt.ask("[yellow]What to change?[/yellow]").strip()
+        if not d:
+            self._a._c.print("[red]Description required[/red]")
+            return False
+        fm = self._a._fm
+        self._a._pn(f"[yellow]Editing: {d}[/yellow]", "Edit")
+        sn = set()
+        jr = self._sj(_PT.build("edit", fm.cx(self._a._cfg._rmc, ck=False, sn=sn), d=d[:2000]), "edit", sn=sn)
+        if not jr:
+            return False
+        jd, es = jr
+        if jd.get("notes"):
+            self._a._c.print(Text(jd["notes"], style="blue"))
+        if not es:
+            self._a._c.print("[yellow]No file changes[/yellow]")
+            return True
+        for fp, a, ct in es:
+            ol = Path(fp).read_text(encoding="utf-8").count("\n") if Path(fp).is_file() else 0
+            nl = ct.count("\n") if ct is not None else 0
+            self._a._c.print(f"[blue]  {a:<7} {fp} ({nl - ol:+d} lines)[/blue]")
+        if not self._a._cf(f"[yellow]Apply {len(es)} changes?[/yellow]", True):
+            self._a._c.print("[yellow]Cancelled[/yellow]")
+            return False
+        n = 0
+        for fp, a, ct in es:
+            if a == "delete":
+                fm._cb(fp)
+                try:
+                    Path(fp).unlink()
+                    self._a._c.print(f"[green]Deleted: {fp}[/green]")
+                    n += 1
+                except OSError as ex:
+                    self._a._c.print(f"[red]Delete failed: {ex}[/red]")
+                continue
+            ct = self._vr(fp, ct, "edit", True)
+            if ct is None:
+                continue
+            if Path(fp).exists():
+                fm._cb(fp)
+            if fm.save(ct, fp, fc=True, rw=True):
+                n += 1
+        self._a._ss.hist("edit", fm._cp, d, json.dumps(jd))
+        self._a._c.print(f"[bold green]✓ Applied {n}/{len(es)} changes[/bold green]")
+        return n == len(es)
+    
+    def _ccm(self, pt: str = None, *dp) -> bool:
+        a = self._a
+        if not a._lm.check_licensed():
+            a._c.print("[red]License required for codemod command[/red]")
+            return False
+        d = ' '.join(dp)
+        if not pt or not d:
+            a._c.print("[red]Usage: codemod <glob> <desc...>[/red]")
+            return False
+        fm = a._fm
+        fs = fm._tgs(pt)
+        fs = [f for f, (ok, _) in zip(fs, fm._isps(fs)) if ok and Path(f).is_file()]
+        if not fs:
+            a._c.print(f"[red]No files match {pt}[/red]")
+            return False
+        ws = [w for w in re.findall(r'[A-Za-z_]\w{2,}', d)]
+        sm = []
+        for f in fs[:200]:
+            try:
+                ct = Path(f).read_text(encoding="utf-8")
+            except (UnicodeDecodeError, OSError):
+                continue
+            if any(w in ct for w in ws) or len(fs) <= 3:
+                sm.append(_PT.ctx(f, ct, 1500))
+            if len(sm) == 3:
+                break
+        a._pn(f"[yellow]Codemod: {pt} ({len(fs)} files)\n{d}[/yellow]", "Codemod")
+        pr = _PT.build("codemod", "\n\n".join(sm) or None, gl=pt, d=d[:2000])
+        for i in range(2):
+            r = a.make_query(pr, "codemod", js=True)
+            if not r:
+                return False
+            sp, em = _jcm(r)
+            if sp:
+                break
+            a._c.print(f"[yellow]Invalid codemod spec: {em}[/yellow]")
+            pr = pr + [{"role": "assistant", "content": r},
+                       {"role": "user", "content": _PT._T["rejson"].substitute(em=em)}]
+        else:
+            return False
+        rs = [(x["find"], x["replace"]) for x in sp.get("rules", [])]
+        rn = sp.get("renames", {})
+        if sp.get("notes"):
+            a._c.print(Text(sp["notes"], style="blue"))
+        for f, x in rs:
+            a._c.print(Text(f"  s/{f}/{x}/", style="blue"))
+        for k, v in rn.items():
+            a._c.print(Text(f"  rename {k} -> {v}", style="blue"))
+        t0 = time.time()
+        ch = []
+        try:
+            fu = [(f, a._vp._pool().submit(_cmx, f, rs, rn)) for f in fs]
+            for f, x in fu:
+                x = x.result(timeout=30)
+                if x[1]:
+                    ch.append(x)
+        except FutureTimeout:
+            a._vp.reset()
+            a._c.print(f"[red]Transformation timed out on {escape(f)} (pattern too slow?); nothing changed[/red]")
+            return False
+        except BrokenProcessPool:
+            a._vp.reset()
+            a._c.print("[red]Transformation workers crashed; nothing changed[/red]")
+            return False
+        a._c.print(f"[blue]{len(ch)}/{len(fs)} files change ({time.time() - t0:.1f}s)[/blue]")
+        if not ch:
+            return True
+        for fp, _, _, ad, rm in ch[:20]:
+            a._c.print(f"[blue]  +{ad:<4} -{rm:<4} {escape(fp)}[/blue]")
+        if len(ch) > 20:
+            a._c.print(f"[blue]  ... {len(ch) - 20} more[/blue]")
+        a._c.print(f"[blue]Total: +{sum(x[3] for x in ch)} -{sum(x[4] for x in ch)} lines[/blue]")
+        fp, ct = ch[0][:2]
+        with open(fp, encoding="utf-8", newline="") as f:
+            ol = f.read()
+        df = difflib.unified_diff(ol.splitlines(), ct.splitlines(),
+                                  fp, fp, lineterm="")
+        a._c.print(Text("\n".join(list(df)[:40]), style="dim"))
+        bad = []
+        for fp, ct, *_ in ch[:3]:
+            ok, es = a._vp.run(fp, ct)
+            if not ok:
+                bad.append(fp)
+                a._c.print(Text(es[:800], style="red"))
+        if bad and not a._cf(f"[yellow]Checks fail on sample {', '.join(bad)}. Apply anyway?[/yellow]", False):
+            a._c.print("[yellow]Cancelled[/yellow]")
+            return False
+        if not a._cf(f"[yellow]Apply to {len(ch)} files?[/yellow]", True):
+            a._c.print("[yellow]Cancelled[/yellow]")
+            return False
+        
+        def put(x):
+            fp, ct, h = x[:3]
+            p = Path(fp)
+            with _flk(p):
+                try:
+                    with open(p, encoding="utf-8", newline="") as f:
+                        if hashlib.sha256(f.read().encode()).hexdigest() != h:
+                            return fp, "changed on disk"
+                    if not fm._cb(fp, True):
+                        return fp, "backup failed"
+                    _aw(p, ct, nl="")
+                except (OSError, UnicodeDecodeError) as ex:
+                    return fp, str(ex)
+            return fp, ""
+        
+        with ThreadPoolExecutor(max_workers=8) as ex:
+            es = [(fp, em) for fp, em in ex.map(put, ch) if em]
+        for fp, em in es:
+            a._c.print(f"[red]Skipped {escape(fp)}: {em}[/red]")
+        if fm._cp and any(x[0] == os.path.normpath(fm._cp) for x in ch):
+            fm.load(fm._cp)
+        a._ss.hist("codemod", pt, d, json.dumps(sp))
+        a._c.print(f"[bold green]✓ Codemod applied to {len(ch) - len(es)}/{len(ch)} files[/bold green]")
+        if a._cfg._be:
+            a._c.print(f"[blue]Backups in {fm._bd}[/blue]")
+        return not es
+    
+    def _cus(self, *args) -> bool:
+        by, dn = "day", 0
+        it = iter(args)
+        try:
+            for a in it:
+                if a == "--by":
+                    by = next(it, by)
+                elif a == "--days":
+                    dn = int(next(it, "0"))
+        except ValueError:
+            by = ""
+        if by not in _LD._BY and by != "day":
+            self._a._c.print("[red]Usage: usage [--by file|command|model|day|key] [--days N][/red]")
+            return True
+        rs = self._a._ai._ld.report(by, dn)
+        if not rs:
+            self._a._c.print("[yellow]No usage recorded[/yellow]")
+            return True
+        tt = [0, 0, 0, 0.0]
+        for k, (n, pt, ct, co) in rs:
+            self._a._c.print(f"[cyan]{escape(k):<40}[/cyan] calls={n:<5} P={pt:<8} C={ct:<8} ${co:.4f}")
+            tt = [tt[0] + n, tt[1] + pt, tt[2] + ct, tt[3] + co]
+        self._a._c.print(f"[bold]{'total':<40} calls={tt[0]:<5} P={tt[1]:<8} C={tt[2]:<8} ${tt[3]:.4f}[/bold]")
+        return True
+
+    def _rsm(self, fp: str, n: int, tn: int) -> Optional[Tuple[str, str]]:
+        a = self._a
+        try:
+            ct = Path(fp).read_text(encoding="utf-8")
+        except (UnicodeDecodeError, OSError):
+            return None
+        if not ct.strip():
+            return None
+        ct = ct[:a._cfg._rmc]
+        pr = _PT.build("summ", _PT.ctx(fp, _CM.run(fp, ct, el=False)[0] if a._cfg._cpt else ct), fn=fp)
+        m = a._ai.model("review", _PT.flat(pr))
+        ck = "summ:" + m + ":" + hashlib.sha256(ct.encode()).hexdigest()
+        sm = a._ss.cget(ck)
+        if sm is not None:
+            a._c.print(f"[blue][{n}/{tn}] {escape(fp)} (cached)[/blue]")
+            return fp, sm
+        sm = a._ai.query(pr, m, "review", fp, qt=True)
+        if not sm:
+            return None
+        a._ss.cput(ck, sm)
+        a._c.print(f"[blue][{n}/{tn}] {escape(fp)}[/blue]")
+        return fp, sm
+
+    def _crv(self, pt: str = None, *qp) -> bool:
+        a = self._a
+        if not a._lm.check_licensed():
+            a._c.print("[red]License required for review command[/red]")
+            a._c.print("[cyan]Contact: https://www.facebook.com/share/178Nt8BnuP/[/cyan]")
+            return False
+        q = ' '.join(qp)
+        if not pt or not q:
+            a._c.print("[red]Usage: review <dir|glob> <question>[/red]")
+            return False
+        fs = a._fm._xp(pt)
+        if not fs:
+            a._c.print(f"[red]No files match: {pt}[/red]")
+            return False
+        a._pn(f"[yellow]Reviewing {len(fs)} files: {pt}\n{q}[/yellow]", "Review")
+        with a._ai.pool(a._cfg._rw) as ex:
+            ss = [x for x in ex.map(lambda x: self._rsm(x[1], x[0] + 1, len(fs)), enumerate(fs)) if x]
+        if not ss:
+            a._c.print("[red]No summaries[/red]")
+            return False
+        ps = [f"## {fp}\n{sm}" for fp, sm in ss]
+        tb = a._cfg._rtb
+        for _ in range(4):
+            if sum(_MR.est(p) for p in ps) <= tb:
+                break
+            bs, cb, ct = [], [], 0
+            for p in ps:
+                n = _MR.est(p)
+                if cb and ct + n > tb:
+                    bs.append(cb)
+                    cb, ct = [], 0
+                cb.append(p)
+                ct += n
+            bs.append(cb)
+            a._c.print(f"[blue]Combining {len(ps)} summaries in {len(bs)} groups[/blue]")
+            with a._ai.pool(a._cfg._rw) as ex:
+                ps = [x for x in ex.map(lambda b: a._ai.query(_PT.build("merge", ss="\n\n".join(b), q=q),
+                                                             cmd="review", qt=True), bs) if x]
+            if not ps:
+                return False
+        r = a.make_query(_PT.build("review", ss="\n\n".join(ps)[:tb * 4], q=q), "review", pt)
+        if r:
+            a._rr(r, "Review")
+            a._ss.hist("review", pt, q, r)
+        return True
+
+    def _rjb(self, jb: _JB) -> bool:
+        a = self._a
+        td = jb.todo()
+        if not td:
+            a._c.print(f"[green]Job {jb.n} already complete[/green]")
+            return True
+        if not jb.lock():
+            a._c.print(f"[red]Job {jb.n} is running in another process[/red]")
+            return False
+        a._c.print(f"[blue]Job {jb.n}: {len(td)}/{len(jb.us)} units to run ({len(jb.rs)} saved responses)[/blue]")
+        a._jb, a._yes = jb, True
+        try:
+            for i in td:
+                jb.cu = i
+                pts = jb.us[i].split()
+                a._pn(f"[yellow][{i + 1}/{len(jb.us)}] {escape(jb.us[i])}[/yellow]", "Batch")
+                ok = bool(self._cm[pts[0].lower()](*pts[1:]))
+                jb.done(i, ok)
+        finally:
+            a._jb, a._yes = None, False
+            jb.unlock()
+        fl = [i + 1 for i in range(len(jb.us)) if not jb.st.get(i)]
+        if fl:
+            a._c.print(f"[yellow]Job {jb.n}: units {fl} failed; 'resume {jb.n}' retries them[/yellow]")
+        else:
+            a._c.print(f"[bold green]✓ Job {jb.n} complete[/bold green]")
+        return True
+
+    def _cba(self, jf: str = None, n: str = None, *args) -> bool:
+        a = self._a
+        if not a._lm.check_licensed():
+            a._c.print("[red]License required for batch command[/red]")
+            return False
+        if not jf or not a._fm._isp(jf)[0] or not Path(jf).is_file():
+            a._c.print("[red]Usage: batch <jobfile> [<name>] (lines: create|modify <file> <desc...>)[/red]")
+            return False
+        us = []
+        for ln in Path(jf).read_text(encoding="utf-8").splitlines():
+            ln = ln.strip()
+            if ln and not ln.startswith("#"):
+                if ln.split()[0].lower() not in ("create", "modify") or len(ln.split()) < 3:
+                    a._c.print(f"[red]Bad job line: {escape(ln)}[/red]")
+                    return False
+                us.append(ln)
+        if not us:
+            a._c.print("[red]Empty job file[/red]")
+            return False
+        n = n or f"{Path(jf).stem}_{time.strftime('%Y%m%d_%H%M%S')}"
+        if not re.fullmatch(r'[\w.-]+', n) or (a._jd / f"{n}.jsonl").exists():
+            a._c.print(f"[red]Invalid or existing job name: {n}[/red]")
+            return False
+        if not a._cf(f"[yellow]Run {len(us)} units as job {n}?[/yellow]", True):
+            return False
+        return self._rjb(_JB.new(a._jd, n, jf, us))
+
+    def _cre(self, n: str = None, *args) -> bool:
+        a = self._a
+        if not a._lm.check_licensed():
+            a._c.print("[red]License required for batch command[/red]")
+            return False
+        jb = _JB.open(a._jd, n) if n and re.fullmatch(r'[\w.-]+', n) else None
+        if not jb:
+            a._c.print(f"[red]No such job: {n}[/red]")
+            return False
+        return self._rjb(jb)
+
+    def _cjs(self, *args) -> bool:
+        ps = sorted(self._a._jd.glob("*.jsonl"), key=lambda p: p.stat().st_mtime)
+        if not ps:
+            self._a._c.print("[yellow]No jobs[/yellow]")
+        for p in ps:
+            jb = _JB.open(self._a._jd, p.stem)
+            dn = sum(1 for v in jb.st.values() if v)
+            self._a._c.print(f"[cyan]{jb.n}[/cyan]: {dn}/{len(jb.us)} done, {len(jb.rs)} saved responses")
+        return True
+
+    def _cmt(self, cm: Callable, sp: str, tg: str, dp: tuple, vb: str) -> bool:
+        fs = self._a._fm._tgs(sp)
+        if not fs:
+            self._a._c.print(f"[red]No matching files: {sp}[/red]")
+            return False
+        d = ' '.join(dp) or Prompt.ask(f"[yellow]{vb} how?[/yellow]").strip()
+        if not d:
+            self._a._c.print("[red]Description required[/red]")
+            return False
+        self._a._c.print(f"[blue]{len(fs)} files: {', '.join(fs[:10])}{' ...' if len(fs) > 10 else ''}[/blue]")
+        if len(fs) > 1 and not self._a._cf(f"[yellow]{vb} {len(fs)} files?[/yellow]", True):
+            self._a._c.print("[yellow]Cancelled[/yellow]")
+            return False
+        ok = sum(bool(cm(f + ("::" + tg if tg else ""), d)) for f in fs)
+        self._a._c.print(f"[bold green]{vb}: {ok}/{len(fs)} files done[/bold green]")
+        return ok == len(fs)
+    
+    def _bon(self, pr: list, cmd: str, fn: str, tf: Callable, bs: str = "") -> Optional[str]:
+        a = self._a
+        jb = a._jb
+        h = jb.key(pr, cmd) if jb else ""
+        if jb and h in jb.rs:
+            a._c.print("[blue]Using checkpointed response[/blue]")
+            return jb.rs[h]
+        n = a._cfg._cn
+        ts = [round(0.2 + 0.8 * i / (n - 1), 2) for i in range(n)]
+        a._c.print(f"[blue]Generating {n} candidates (temperature {ts[0]}-{ts[-1]})[/blue]")
+        with a._ai.charged(a._lm.use_prompt), a._ai.pool(n) as ex:
+            rs = list(ex.map(lambda t: a._ai.call(pr, cmd=cmd, fp=fn, qt=True, temperature=t), ts))
+        cs = [(t, c) for t, c in ((t, tf(x.t)) for t, x in zip(ts, rs) if x and x.t.strip()) if c]
+        if not cs:
+            return None
+        a._c.print(f"[blue]Tokens: {sum(x.pt + x.ct for x in rs if x)} for {len(cs)} candidates[/blue]")
+        sc = a._vp.score(fn, [ct for _, ct in cs], bs)
+        rk = sorted(range(len(cs)), key=lambda i: (not sc[i][0].get("syntax", True), not sc[i][0].get("test", True),
+                                                   not sc[i][0].get("lint", True),
+                                                   sum(sc[i][1]) if bs else cs[i][0]))
+        cd = Path(".aicode_candidates") / f"{Path(fn).stem}_{time.strftime('%Y%m%d_%H%M%S')}"
+        cd.mkdir(parents=True, exist_ok=True)
+        ln = []
+        for j, i in enumerate(rk):
+            ck, (ad, rm) = sc[i]
+            _aw(cd / f"{j + 1}_t{cs[i][0]}_{Path(fn).name}", cs[i][1])
+            ln.append(f"#{j + 1} t={cs[i][0]} " + ' '.join(f"{k}={'ok' if ok else 'FAIL'}" for k, ok in ck.items())
+                      + f" diff=+{ad}/-{rm}" + ("  <- kept" if not j else ""))
+        _aw(cd / "scores.txt", "\n".join(ln) + "\n")
+        a._c.print(Text("\n".join(ln), style="blue"))
+        a._c.print(f"[blue]All candidates saved in {cd}[/blue]")
+        if jb:
+            jb.put(h, cs[rk[0]][1])
+        return cs[rk[0]][1]
+    
+    def _olf(self, fn: str, cx: Optional[str], d: str) -> Optional[str]:
+        a = self._a
+        sk = a.make_query(_PT.build("outline", cx, fn=fn, d=d), "create", fn)
+        if not sk:
+            return None
+        sk = a._fm._ecfr(sk)
+        try:
+            tree = ast.parse(sk)
+        except SyntaxError as ex:
+            a._c.print(f"[red]Outline is not valid Python: line {ex.lineno}: {ex.msg}[/red]")
+            return None
+        ss = [(q, *_TG._span(n)) for q, n, _ in _TG._defs(tree) if _TG.stub(n)]
+        if not ss:
+            return sk
+        a._c.print(f"[blue]Outline: {sk.count(chr(10)) + 1} lines, filling {len(ss)} functions in parallel[/blue]")
+        jb, sc = a._jb, _PT.sigs(fn, sk)
+        
+        def fill(x):
+            q, s, e = x
+            pr = _PT.build("fill", sc, fn=fn, q=q, rg=_TG.region(sk, s, e), d=d)
+            h = jb.key(pr, "create") if jb else ""
+            if jb and h in jb.rs:
+                return jb.rs[h]
+            for _ in range(2):
+                r = a._ai.call(pr, cmd="create", fp=fn, qt=True)
+                if not r or not r.t.strip():
+                    return None
+                try:
+                    ast.parse(textwrap.dedent(a._fm._ecfr(r.t)))
+                except SyntaxError:
+                    continue
+                if jb:
+                    jb.put(h, r.t)
+                return r.t
+            return None
+        
+        t0 = time.time()
+        with a._ai.pool(a._cfg._rw) as ex:
+            rs = list(ex.map(fill, ss))
+        for (q, s, e), r in sorted(zip(ss, rs), key=lambda x: -x[0][1]):
+            if r:
+                sk = _TG.splice(sk, s, e, a._fm._ecfr(r))
+            else:
+                a._c.print(f"[yellow]Could not fill {q}; left as a stub[/yellow]")
+        a._c.print(f"[blue]Filled {sum(map(bool, rs))}/{len(ss)} functions in {time.time() - t0:.1f}s[/blue]")
+        return sk
+    
     def _ccr(self, fn: str = None, *dp) -> bool:
         if not self._a._lm.check_licensed():
             self._a._c.print("[red]License required for create command[/red]")
             self._a._c.print("[cyan]Contact: https://www.facebook.com/share/178Nt8BnuP/[/cyan]")
-            return True
+            return False
         
         if not fn:
             fn = Prompt.ask("[yellow]Filename[/yellow]").strip()
         if not fn:
             self._a._c.print("[red]Filename required[/red]")
             return False
+        if self._a._fm._GC.search(fn) or "," in fn:
+            return self._cmt(self._ccr, fn, "", dp, "Create")
         
         ivn, em = self._a._fm._vfn(fn)
         if not ivn:
@@ -543,9 +3452,10 @@ class _CP:
             return False
         
         p = Path(fn)
+        self._a._fm.mark(fn)
         if p.exists():
             self._a._c.print(f"[yellow]File exists: {fn}[/yellow]")
-            if not Confirm.ask("[yellow]Overwrite?[/yellow]"):
+            if not self._a._cf("[yellow]Overwrite?[/yellow]"):
                 self._a._c.print("[yellow]Cancelled[/yellow]")
                 return False
             self._a._fm._cb(fn)
@@ -559,27 +3469,26 @@ class _CP:
         if len(d) > 1000:
             d = d[:1000]
         
-        self._a._c.print(Panel(f"[yellow]Creating: {fn}\n{d}[/yellow]", title="Create", padding=(1, 2)))
-        
-        ctx = ""
-        if self._a._fm._cc:
-            ctx = f"\n\nContext from {self._a._fm._cp}:\n{self._a._fm._cc[:2000]}"
-        
-        pr = f"""Expert code generator. Create production-quality code.
-
-CRITICAL: Output ONLY code - no markdown, no fences, no explanations.
-
-Target: {fn}
-Request: {d}{ctx}
-
-Generate complete code:"""
+        self._a._pn(f"[yellow]Creating: {fn}\n{d}[/yellow]", "Create")
         
-        r = self._a.make_query(pr)
+        fm = self._a._fm
+        cx = fm.cx(d=d)
+        if self._a._cfg._so:
+            r = self._sjf(fn, f"Create {fn}: {d}", cx, "create")
+        elif self._a._cfg._ol and fn.endswith(".py"):
+            r = self._olf(fn, cx, d)
+        elif self._a._cfg._cn > 1:
+            r = self._bon(_PT.build("create", cx, fn=fn, d=d), "create", fn, fm._ecfr)
+        else:
+            r = self._a.make_query(_PT.build("create", cx, fn=fn, d=d), "create", fn)
         if r:
-            self._a._c.print(Panel(Text(r[:500] + "..." if len(r) > 500 else r, style="green"), title="Generated", padding=(1, 2)))
-            if Confirm.ask("[yellow]Save?[/yellow]", default=True):
-                if self._a._fm.save(content=r, filepath=fn, fc=True):
+            r = self._vr(fn, r, "create", self._a._cfg._so)
+        if r:
+            self._a._rr(r[:500] + "..." if len(r) > 500 else r, "Generated", fn)
+            if self._a._cf("[yellow]Save?[/yellow]", True):
+                if self._a._fm.save(r, fn, fc=True, rw=self._a._cfg._so):
                     self._a._fm.load(fn)
+                    self._a._ss.hist("create", fn, d, r)
                     self._a._c.print(f"[bold green]✓ Created {fn}[/bold green]")
                     return True
             else:
@@ -590,13 +3499,16 @@ Generate complete code:"""
         if not self._a._lm.check_licensed():
             self._a._c.print("[red]License required for modify command[/red]")
             self._a._c.print("[cyan]Contact: https://www.facebook.com/share/178Nt8BnuP/[/cyan]")
-            return True
+            return False
         
         if not fn:
             fn = Prompt.ask("[yellow]Filename to modify[/yellow]").strip()
         if not fn:
             self._a._c.print("[red]Filename required[/red]")
             return False
+        fn, _, tg = fn.partition("::")
+        if self._a._fm._GC.search(fn) or "," in fn:
+            return self._cmt(self._cmo, fn, tg, dp, "Modify")
         
         ivn, em = self._a._fm._vfn(fn)
         if not ivn:
@@ -611,7 +3523,7 @@ Generate complete code:"""
         p = Path(fn)
         if not p.exists():
             self._a._c.print(f"[red]Not found: {fn}[/red]")
-            if Confirm.ask("[yellow]Create instead?[/yellow]"):
+            if self._a._cf("[yellow]Create instead?[/yellow]", False, False):
                 return self._ccr(fn, *dp)
             return False
         
@@ -634,33 +3546,76 @@ Generate complete code:"""
         if len(d) > 1000:
             d = d[:1000]
         
-        self._a._c.print(Panel(f"[yellow]Modifying: {fn}\n{d}[/yellow]", title="Modify", padding=(1, 2)))
+        cc = self._a._fm._cc
+        lx = None if tg else _LX.run(d, fn, cc)
+        if lx:
+            self._a._c.print(f"[blue]Local: {lx[1]}[/blue]")
+            if lx[0] is None or lx[0] == cc:
+                if lx[0] is not None:
+                    self._a._c.print("[green]Nothing to change[/green]")
+                return True
+            return self._cms(fn, d, lx[0], cc.count('\n') + 1, len(cc), True)
+        if not tg:
+            tg = _TG.guess(cc, d, fn) or ""
+            if tg:
+                self._a._c.print(f"[blue]Target detected: {tg} (use {fn}::<target> to override)[/blue]")
+        rg = _TG.find(cc, tg, fn) if tg else None
+        if tg and not rg:
+            self._a._c.print(f"[red]Target not found: {tg}[/red]")
+            return False
+        
+        self._a._pn(f"[yellow]Modifying: {fn}{'::' + tg if tg else ''}\n{d}[/yellow]", "Modify")
         
-        lc = self._a._fm._cc.count('\n') + 1
-        chc = len(self._a._fm._cc)
+        lc = cc.count('\n') + 1
+        chc = len(cc)
         self._a._c.print(f"[blue]Current: {lc} lines, {chc} chars[/blue]")
         
-        pr = f"""Expert code modifier. Modify code based on request.
-
-CRITICAL: Output ONLY complete modified code - no markdown, no fences, no explanations.
-
-Current code from {fn}:
-{self._a._fm._cc}
-
-Modification: {d}
-
-Generate complete modified code:"""
+        if rg:
+            s, e, cx = rg
+            self._a._c.print(f"[blue]Region: lines {s + 1}-{e} ({e - s} lines)[/blue]")
+            pr = _PT.build("region", _PT.sigs(fn, cx) if cx else None,
+                           fn=fn, s=s + 1, e=e, rg=_TG.region(cc, s, e), d=d)
+            if self._a._cfg._cn > 1:
+                r = self._bon(pr, "modify", fn, lambda x: _TG.splice(cc, s, e, self._a._fm._ecfr(x)), cc)
+            else:
+                r = self._a.make_query(pr, "modify", fn)
+                if r:
+                    r = _TG.splice(cc, s, e, self._a._fm._ecfr(r))
+            return self._cms(fn, d, r, lc, chc)
         
-        r = self._a.make_query(pr)
+        if self._a._cfg._so:
+            r = self._sjf(fn, f"Modify {fn}: {d}", _PT.ctx(fn, cc), "modify")
+            return self._cms(fn, d, r, lc, chc)
+        cm, mp = _CM.run(fn, cc, d, tv=False) if self._a._cfg._cpt else (cc, {})
+        cx = _PT.ctx(fn, cm)
+        if mp:
+            _CM.rep(self._a._c, fn, cc, cm)
+            cx += "\n\n" + _PT._T["keep"].template
+        tf = lambda x: _CM.restore(self._a._fm._ecfr(x), mp)
+        if self._a._cfg._cn > 1:
+            r = self._bon(_PT.build("modify", cx, fn=fn, d=d), "modify", fn, tf, cc)
+        else:
+            r = self._a.make_query(_PT.build("modify", cx, fn=fn, d=d), "modify", fn)
+            if r and mp:
+                r = tf(r)
+                if r is None:
+                    self._a._c.print("[red]Response dropped elided code markers; retry without --compact[/red]")
+        return self._cms(fn, d, r, lc, chc)
+
+    def _cms(self, fn: str, d: str, r: Optional[str], lc: int, chc: int, rw: Optional[bool] = None) -> bool:
+        rw = self._a._cfg._so if rw is None else rw
+        if r:
+            r = self._vr(fn, r, "modify", rw)
         if r:
-            self._a._c.print(Panel(Text(r[:500] + "..." if len(r) > 500 else r, style="green"), title="Modified", padding=(1, 2)))
+            self._a._rr(r[:500] + "..." if len(r) > 500 else r, "Modified", fn)
             nlc = r.count('\n') + 1
             nchc = len(r)
             self._a._c.print(f"[blue]Modified: {nlc} lines, {nchc} chars[/blue]")
             self._a._c.print(f"[blue]Change: {nlc - lc:+d} lines, {nchc - chc:+d} chars[/blue]")
-            if Confirm.ask("[yellow]Save modifications?[/yellow]", default=True):
-                if self._a._fm.save(content=r, filepath=fn, fc=True):
+            if self._a._cf("[yellow]Save modifications?[/yellow]", True):
+                if self._a._fm.save(r, fn, fc=True, rw=rw):
                     self._a._fm.load(fn)
+                    self._a._ss.hist("modify", fn, d, r)
                     self._a._c.print(f"[bold green]✓ Modified {fn}[/bold green]")
                     self._a._c.print(f"[blue]Backup in {self._a._fm._bd}[/blue]")
                     return True
@@ -668,50 +3623,100 @@ Generate complete modified code:"""
                 self._a._c.print("[yellow]Cancelled[/yellow]")
         return False
 
+class _DW(io.TextIOBase):
+    def __init__(self, f):
+        self._f = f
+    
+    def write(self, s: str) -> int:
+        if s:
+            self._f.write(json.dumps({"o": s}) + "\n")
+            self._f.flush()
+        return len(s)
+    
+    def isatty(self) -> bool:
+        return False
+
 class AicodeApp:
     def __init__(self, cfg: Config):
         self._cfg = cfg
-        self._c = Console()
-        self._lm = _LM(self._c)
-        self._tm = _TM(cfg, self._c)
-        self._fm = _FM(self._c, cfg)
-        self._ai = _AI(self._tm, cfg, self._c)
+        self._c = Console(no_color=True, highlight=False, emoji=False, soft_wrap=True) if cfg._pl else Console()
+        self._lst: Optional[str] = None
+        self._yes = False
+        self._dcl = False
+        self._jb: Optional[_JB] = None
+        self._jd = Path(".aicode_jobs")
+        self._ss = _SS(self._c, cfg)
+        self._lm = _LM(self._c, self._ss)
+        self._tm = _TM(cfg, self._c, self._ss)
+        self._fm = _FM(self._c, cfg, self._cf)
+        self._ai = _AI(self._tm, cfg, self._c, self._ss)
+        self._vp = _VP(self._c, cfg)
         self._cp = _CP(self)
+        self._ag = _AG(self)
+        if cfg._prf:
+            _pf.on, _pf.d = True, Path(cfg._prf)
         self._su()
     
     def _su(self) -> None:
         tfe = self._tm.load_from_env()
+        if self._cfg._rpf or "groq" not in self._ai.used():
+            return
         if not self._tm._at:
             self._tm.prompt_for_token()
         if not self._tm.initialize_client():
             sys.exit(1)
     
-    def make_query(self, pr: str) -> Optional[str]:
-        if not self._lm.use_prompt():
-            return None
-        return self._ai.query(pr)
+    def _cf(self, q: str, d: bool = False, au: bool = True) -> bool:
+        if self._yes:
+            return au
+        if self._dcl:
+            self._c.print(f"{q} no (pass --yes to confirm)")
+            return False
+        return Confirm.ask(q, default=d)
     
-    def _gp(self, ui: str) -> str:
-        ctx = ""
-        if self._fm._cc:
-            cp = self._fm._cc[:2000]
-            if len(self._fm._cc) > 2000:
-                cp += "\n... (truncated)"
-            ctx = f"\n\nCurrent file context ({self._fm._cp}):\n{cp}"
-        
-        return f"""Expert AI code assistant. Respond to code requests.
-
-INSTRUCTIONS:
-1. Clear, concise, accurate responses
-2. Complete, production-ready code
-3. Proper error handling
-4. Explain changes when modifying
-5. Be helpful and educational
-{ctx}
-
-User request: {ui}
-
-Response:"""
+    def make_query(self, pr, cmd: str = "chat", fp: Optional[str] = None,
+                   js: bool = False) -> Optional[str]:
+        jb = self._jb
+        if jb:
+            h = jb.key(pr, cmd)
+            if h in jb.rs:
+                self._c.print("[blue]Using checkpointed response[/blue]")
+                return jb.rs[h]
+        with self._ai.charged(self._lm.use_prompt):
+            r = self._ai.query(pr, cmd=cmd, fp=fp or self._fm._cp, js=js)
+        if jb and r:
+            jb.put(h, r)
+        return r
+    
+    def _chat(self, ui: str) -> bool:
+        self._pn(f"[bold yellow]User: {ui}[/bold yellow]", "Request")
+        if self._lx(ui):
+            return True
+        r = self._ag.run(ui) if self._cfg._ag else self.make_query(self._gp(ui))
+        if r:
+            self._rr(r, "AI Response")
+            self._ss.hist("chat", self._fm._cp, ui, r)
+            self._fm.update_from_response(r, ui)
+        return bool(r)
+    
+    def _lx(self, ui: str) -> bool:
+        fp, ct = self._fm._cp, self._fm._cc
+        lx = _LX.run(ui, fp, ct) if fp and ct is not None else None
+        if not lx or (lx[0] is not None and not self._lm.check_licensed()):
+            return False
+        self._c.print(f"[blue]Local: {lx[1]}[/blue]")
+        if lx[0] is None:
+            return True
+        if lx[0] == ct:
+            self._c.print("[green]Nothing to change[/green]")
+            return True
+        self._fm._cb(fp)
+        self._cp._cms(fp, ui, lx[0], ct.count('\n') + 1, len(ct), True)
+        return True
+    
+    def _gp(self, ui: str) -> list:
+        cx = self._fm.cx(d=ui)
+        return _PT.build("chat", cx, ui=ui)
     
     def _gst(self) -> str:
         if self._lm._l:
@@ -720,14 +3725,137 @@ Response:"""
         else:
             ls = f" | Free prompts: {self._lm._rf}"
         cfs = f" | Current: {self._fm._cp}" if self._fm._cp else " | Current: None"
+        if self._fm._xs:
+            cfs += f" (+{len(self._fm._xs)} files)"
         ks = f" | API Keys: {len(self._tm._ts)}" if self._tm._ts else " | No keys"
-        return f"[bold green]Status: Ready | Model: {self._cfg._dm}{ks}{ls}{cfs}[/bold green]"
+        bs = f" | Backend: {self._cfg._bk}"
+        if self._cfg._rr:
+            bs += " (" + ', '.join(f"{k}={v}" for k, v in self._cfg._rr.items()) + ")"
+        ms = f"{self._ai._lm} (auto)" if self._ai._lm else "auto"
+        return f"[bold green]Status: Ready | Model: {ms}{bs}{ks}{ls}{cfs}[/bold green]"
+    
+    @_pf.wrap("render")
+    def _pn(self, m, t: Optional[str] = None) -> None:
+        if self._cfg._pl:
+            self._c.print(m)
+        else:
+            self._c.print(Panel(m, title=t, padding=(1, 2)))
+    
+    @_pf.wrap("render")
+    def _rr(self, r: str, t: str, fn: Optional[str] = None) -> None:
+        if self._cfg._pl:
+            sys.stdout.write(r if r.endswith("\n") else r + "\n")
+            sys.stdout.flush()
+            return
+        ls = r.splitlines()
+        n = self._cfg._pgl
+        if len(ls) <= n:
+            self._c.print(Panel(Text(r, style="green"), title=t, padding=(1, 2)))
+            return
+        if self._cfg._pg and self._c.is_terminal:
+            with self._c.pager():
+                self._c.print(Text(r))
+            return
+        lx = Syntax.guess_lexer(fn) if fn else "text"
+        self._c.rule(t)
+        for i in range(0, len(ls), n):
+            ch = "\n".join(ls[i:i + n])
+            if lx in ("text", "default"):
+                self._c.print(Text(ch, style="green"))
+            else:
+                self._c.print(Syntax(ch, lx, start_line=i + 1, line_numbers=True))
+        self._c.rule()
     
     def _ps(self) -> None:
-        self._c.print(Panel(self._gst(), title="System Status", padding=(1, 2)))
+        st = self._gst()
+        if st == self._lst:
+            return
+        self._lst = st
+        self._pn(st, "System Status")
+    
+    def _one(self, ui: str) -> bool:
+        c = ui.split()[0].lower()
+        if c == "profile":
+            return self._cp.process(ui)
+        if c in self._cp._cm:
+            return _pf.run(self._c, c, self._cp.process, ui)
+        return _pf.run(self._c, "chat", self._chat, ui)
+    
+    def _srq(self, cn: socket.socket) -> bool:
+        f = cn.makefile("rw", encoding="utf-8", newline="\n")
+        try:
+            rq = json.loads(f.readline() or "{}")
+        except ValueError:
+            return True
+        wr, rc = _DW(f), 1
+        if rq.get("op") == "stop":
+            wr.write("Daemon stopped\n")
+            f.write(json.dumps({"rc": 0}) + "\n")
+            f.flush()
+            return False
+        if Path(rq.get("cwd") or "/").resolve() != self._fm._rt:
+            wr.write(f"This daemon serves {self._fm._rt}; run the client from there\n")
+        elif rq.get("cmd", "").strip():
+            of, oy, oi = self._c.file, self._yes, sys.stdin
+            self._c.file, self._yes, self._dcl, sys.stdin = wr, rq.get("yes") is True, True, io.StringIO()
+            try:
+                with redirect_stdout(wr):
+                    rc = 0 if self._one(rq["cmd"].strip()) else 1
+            except SystemExit:
+                rc = 0
+            except EOFError:
+                self._c.print("[red]More input needed; pass all arguments on the command line[/red]")
+            except OSError:
+                return True
+            except Exception as ex:
+                self._pn(f"[bold red]Error: {ex}[/bold red]", "Error")
+            finally:
+                self._c.file, self._yes, self._dcl, sys.stdin = of, oy, False, oi
+        try:
+            f.write(json.dumps({"rc": rc}) + "\n")
+            f.flush()
+        except OSError:
+            pass
+        return True
+    
+    def serve(self, sp: str) -> None:
+        if Path(sp).exists():
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                    s.connect(sp)
+                self._c.print(f"[red]A daemon is already listening on {sp}[/red]")
+                sys.exit(1)
+            except ConnectionRefusedError:
+                os.unlink(sp)
+        sv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        om = os.umask(0o177)
+        try:
+            sv.bind(sp)
+        finally:
+            os.umask(om)
+        sv.listen(16)
+        self._c.print(f"[green]Daemon listening on {sp} (Ctrl-C or --stop-daemon to stop)[/green]")
+        try:
+            while True:
+                cn, _ = sv.accept()
+                with cn:
+                    go = self._srq(cn)
+                    try:
+                        cn.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+                if not go:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sv.close()
+            if Path(sp).exists():
+                os.unlink(sp)
+            self._ss.flush()
     
     def _he(self) -> None:
-        self._c.print(Panel("[bold green]Thanks for using Aicode Pro![/bold green]", title="Goodbye", padding=(1, 2)))
+        self._pn("[bold green]Thanks for using Aicode Pro![/bold green]", "Goodbye")
         sys.exit(0)
     
     def run(self) -> None:
@@ -738,7 +3866,8 @@ Response:"""
  / /_\\\\ | | (_| (_) | (_| |  __/|  __/| | | (_) |
  \\____/ |_|\\___\\___/ \\__,_|\\___||_|   |_|  \\___/ 
         """
-        self._c.print(f"[bold magenta]{bn}[/bold magenta]")
+        if not self._cfg._pl:
+            self._c.print(f"[bold magenta]{bn}[/bold magenta]")
         
         wt = """
 [bold cyan]Aicode Pro - Production AI Code Assistant[/bold cyan]
@@ -765,7 +3894,7 @@ Visit: https://console.groq.com
 Facebook: https://www.facebook.com/share/178Nt8BnuP/
 Telegram: t.me/JadXHex
         """
-        self._c.print(Panel(wt.strip(), title="[bold blue]Welcome to Aicode Pro[/bold blue]", padding=(1, 2)))
+        self._pn(wt.strip(), "[bold blue]Welcome to Aicode Pro[/bold blue]")
         
         self._cp._ch()
         self._ps()
@@ -773,55 +3902,35 @@ Telegram: t.me/JadXHex
         while True:
             try:
                 ui = Prompt.ask("[yellow]AicodePro>> [/yellow]", default="").strip()
+            except (KeyboardInterrupt, EOFError):
+                self._he()
+            try:
                 if not ui:
                     continue
                 
-                if self._cp.process(ui):
-                    self._ps()
-                    continue
-                
                 # Check license/free prompts BEFORE processing chat
-                if not self._lm._l and self._lm._rf <= 0:
+                if ui.split()[0].lower() not in self._cp._cm and not self._lm._l and self._lm._rf <= 0:
                     self._c.print("[red]Free trial exhausted. License required.[/red]")
                     self._c.print("[cyan]Contact: https://www.facebook.com/share/178Nt8BnuP/[/cyan]")
                     self._c.print("[cyan]Telegram: t.me/JadXHex[/cyan]")
                     t = Prompt.ask("[bold]Enter license token (or 'exit' to quit)[/bold]", password=False).strip()
                     if t.lower() == 'exit':
                         self._he()
-                    if t:
-                        e = self._lm._vt(t)
-                        if e and e >= date.today():
-                            try:
-                                with open(".aicode_license", "w") as f:
-                                    f.write(t)
-                                self._lm._l = True
-                                self._lm._ed = e
-                                self._c.print(f"[green]License activated until {e.isoformat()}[/green]")
-                                up = Path(".aicode_usage.json")
-                                if up.exists():
-                                    up.unlink()
-                            except Exception as ex:
-                                self._c.print(f"[red]Save error: {ex}[/red]")
-                                continue
-                        else:
-                            self._c.print("[red]Invalid token[/red]")
-                            continue
-                    else:
+                    if not t or not self._lm.activate(t):
                         continue
                 
-                self._c.print(Panel(f"[bold yellow]User: {ui}[/bold yellow]", title="Request", padding=(1, 2)))
-                pr = self._gp(ui)
-                r = self.make_query(pr)
-                if r:
-                    self._c.print(Panel(Text(r, style="green"), title="AI Response", padding=(1, 2)))
-                    self._fm.update_from_response(r, ui)
-                    time.sleep(1)
-                
+                self._one(ui)
                 self._ps()
+            except _CE:
+                self._c.print("[yellow]Request cancelled[/yellow]")
             except KeyboardInterrupt:
+                if time.time() - self._ai._cx < 2:
+                    self._he()
+                self._c.print("[yellow]Interrupted[/yellow]")
+            except EOFError:
                 self._he()
             except Exception as ex:
-                self._c.print(Panel(f"[bold red]Error: {ex}[/bold red]", title="Error", padding=(1, 2)))
+                self._pn(f"[bold red]Error: {ex}[/bold red]", "Error")
 
 def main():
     parser = argparse.ArgumentParser(
@@ -831,6 +3940,16 @@ def main():
 Examples:
   python aicode_pro.py --api-key YOUR_KEY
   python aicode_pro.py --no-backup
+  python aicode_pro.py --backend local --local-url http://127.0.0.1:8080/v1
+  python aicode_pro.py --route chat=local --route create=groq
+  python aicode_pro.py --pin modify=llama-3.3-70b-versatile
+  python aicode_pro.py --plain
+  python aicode_pro.py --record session.jsonl.gz
+  python aicode_pro.py --replay session.jsonl.gz --replay-speed 10
+  python aicode_pro.py --profile
+  python aicode_pro.py --candidates 4 --lint --test-cmd "pytest -q"
+  python aicode_pro.py --daemon &
+  python aicode_pro.py --client modify app.py add logging
 
 Free tier: Basic chat (5 prompts)
 Licensed: Unlimited prompts + file management commands
@@ -839,22 +3958,117 @@ Licensed: Unlimited prompts + file management commands
     parser.add_argument("--api-key", help="Groq API key")
     parser.add_argument("--no-backup", action="store_true", help="Disable backups")
     parser.add_argument("--max-file-size", type=int, default=1_000_000, help="Max file size (bytes)")
+    parser.add_argument("--backend", choices=_BKS, help="Default model backend")
+    parser.add_argument("--route", action="append", default=[], metavar="CMD=BACKEND",
+                        help="Route a command (chat, create, modify) to a backend")
+    parser.add_argument("--local-url", help="OpenAI-compatible server URL (llama.cpp, vLLM)")
+    parser.add_argument("--local-model", help="Model name for the local backend")
+    parser.add_argument("--model", help="Model for large/complex requests")
+    parser.add_argument("--fast-model", help="Model for small/simple requests")
+    parser.add_argument("--plain", action="store_true", help="Raw text output, no panels or colors")
+    parser.add_argument("--pager", action="store_true", help="Page long responses")
+    parser.add_argument("--page-lines", type=int, default=200,
+                        help="Responses longer than this render in chunks (or the pager)")
+    parser.add_argument("--no-validate", action="store_true", help="Skip checks before saving generated code")
+    parser.add_argument("--lint", action="store_true", help="Run linters (ruff/pyflakes/eslint) before saving")
+    parser.add_argument("--test-cmd", help="Test command run on generated code ({f} = candidate file)")
+    parser.add_argument("--repairs", type=int, default=2, help="Max automatic repair requests")
+    parser.add_argument("--cache", action="store_true", help="Reuse responses for identical prompts")
+    parser.add_argument("--agent", action="store_true", help="Chat uses tool calls to read project files")
+    parser.add_argument("--agent-steps", type=int, default=6, help="Max tool rounds per agent turn")
+    parser.add_argument("--agent-tokens", type=int, default=24000, help="Token limit per agent turn")
+    parser.add_argument("--candidates", type=int, default=1, metavar="N",
+                        help="create/modify generate N candidates in parallel and keep the best")
+    parser.add_argument("--outline", action="store_true",
+                        help="create .py files as an outline first, then fill function bodies in parallel")
+    parser.add_argument("--compact", action="store_true",
+                        help="Strip comments/docstrings and elide unrelated function bodies in file context")
+    parser.add_argument("--structured", action="store_true",
+                        help="create/modify ask for JSON edits instead of extracting code from text")
+    parser.add_argument("--budget", action="append", default=[], metavar="[CMD.]SCOPE=LIMIT",
+                        help="Token or $cost budget per session/day, e.g. day=200000, create.session=$0.50")
+    parser.add_argument("--budget-mode", choices=("warn", "refuse"), help="What to do when over budget")
+    rg = parser.add_mutually_exclusive_group()
+    rg.add_argument("--record", metavar="FILE", help="Record requests and responses to a gzip JSONL cassette")
+    rg.add_argument("--replay", metavar="FILE", help="Serve responses from a cassette, no network")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="Replay timing factor (2 = twice as fast, 0 = no delays)")
+    parser.add_argument("--pin", action="append", default=[], metavar="CMD=MODEL",
+                        help="Always use MODEL for CMD")
+    parser.add_argument("--profile", nargs="?", const=".aicode_profiles", metavar="DIR",
+                        help="Profile every command and write reports to DIR")
+    dg = parser.add_argument_group("daemon")
+    dg.add_argument("--daemon", action="store_true", help="Serve commands on a Unix socket instead of the REPL")
+    dg.add_argument("--socket", default=".aicode.sock", help="Daemon socket path")
+    dg.add_argument("--client", nargs=argparse.REMAINDER, metavar="CMD",
+                    help="Send one command to the daemon ([--yes] CMD; first option to skip startup)")
+    dg.add_argument("--stop-daemon", action="store_true", help="Ask the daemon to exit")
     args = parser.parse_args()
+    if args.client is not None or args.stop_daemon:
+        sys.exit(_tc(["--socket", args.socket] + (["--stop-daemon"] if args.stop_daemon else args.client or [])))
     
     if not _v('aicode_pro_v1_integrity_2025'):
         print("Integrity check failed")
         sys.exit(1)
     
     cfg = Config()
+    if Path(cfg._ef).exists():
+        load_dotenv(dotenv_path=cfg._ef)
     if args.api_key:
         os.environ["GROQ_API_KEYS"] = args.api_key
     if args.no_backup:
         cfg._be = False
+    cfg._pl = args.plain
+    cfg._pg = args.pager
+    cfg._pgl = max(1, args.page_lines)
+    cfg._vl = not args.no_validate
+    cfg._vln = args.lint
+    cfg._vtc = args.test_cmd or os.getenv("AICODE_TEST_CMD")
+    cfg._vrn = max(0, args.repairs)
+    cfg._rc = args.cache
+    cfg._so = args.structured
+    cfg._cpt = args.compact
+    cfg._ol = args.outline
+    cfg._ag = args.agent
+    cfg._cn = min(8, max(1, args.candidates))
+    cfg._ags = max(0, args.agent_steps)
+    cfg._agt = max(1, args.agent_tokens)
+    try:
+        cfg._bud = _pbd(os.getenv("AICODE_BUDGETS", ""))
+        cfg._bud.update(_pbd(','.join(args.budget)))
+    except ValueError as ex:
+        print(f"Invalid budget: {ex}")
+        sys.exit(1)
+    cfg._bum = args.budget_mode or os.getenv("AICODE_BUDGET_MODE", cfg._bum)
+    cfg._rcf = args.record
+    cfg._rpf = args.replay
+    cfg._rps = max(0.0, args.replay_speed)
+    cfg._prf = args.profile
+    if cfg._rpf and not Path(cfg._rpf).exists():
+        print(f"Cassette not found: {cfg._rpf}")
+        sys.exit(1)
     if args.max_file_size:
         cfg._mfs = args.max_file_size
+    cfg._bk = args.backend or os.getenv("AICODE_BACKEND", cfg._bk)
+    cfg._lu = args.local_url or os.getenv("AICODE_LOCAL_URL", cfg._lu)
+    cfg._lmd = args.local_model or os.getenv("AICODE_LOCAL_MODEL", cfg._lmd)
+    cfg._rr = _prr(os.getenv("AICODE_ROUTES", ""))
+    cfg._rr.update(_prr(','.join(args.route)))
+    cfg._rr = {k: v.lower() for k, v in cfg._rr.items()}
+    cfg._dm = args.model or os.getenv("AICODE_MODEL", cfg._dm)
+    cfg._fdm = args.fast_model or os.getenv("AICODE_FAST_MODEL", cfg._fdm)
+    cfg._pin = _prr(os.getenv("AICODE_PINS", ""))
+    cfg._pin.update(_prr(','.join(args.pin)))
+    bad = [v for v in [cfg._bk, *cfg._rr.values()] if v not in _BKS]
+    if bad:
+        print(f"Unknown backend: {', '.join(bad)}")
+        sys.exit(1)
     
     app = AicodeApp(cfg)
-    app.run()
+    if args.daemon:
+        app.serve(args.socket)
+    else:
+        app.run()
 
 if __name__ == "__main__":
     main()
@@ -5,16 +5,50 @@ Installs all dependencies and sets up the application
 """
 
 import os
+import re
 import sys
+import argparse
 import subprocess
 import platform
 from pathlib import Path
 
+try:
+    from importlib import metadata as importlib_metadata
+except ImportError:  # Python 3.7
+    try:
+        import importlib_metadata
+    except ImportError:
+        importlib_metadata = None
+
+DEPENDENCIES = [
+    "groq>=0.4.0",
+    "rich>=12.0.0",
+    "python-dotenv>=0.19.0",
+]
+
+def parse_requirement(spec):
+    """Split 'name>=1.2' into (name, minimum version or None)"""
+    name, _, minimum = spec.partition(">=")
+    return name.strip(), minimum.strip() or None
+
+def version_tuple(version):
+    """Numeric release tuple for simple version comparison ('1.10.0rc1' -> (1, 10, 0))"""
+    parts = []
+    for part in version.split("."):
+        match = re.match(r"\d+", part)
+        if not match:
+            break
+        parts.append(int(match.group()))
+        if match.end() < len(part):
+            break
+    return tuple(parts)
+
 class AicodeInstaller:
-    def __init__(self):
+    def __init__(self, wheelhouse=None):
         self.console_width = 70
         self.is_termux = os.path.exists('/data/data/com.termux')
         self.python_cmd = 'python3' if platform.system() != 'Windows' else 'python'
+        self.wheelhouse = wheelhouse
     
     def print_banner(self):
         banner = """
@@ -77,43 +111,83 @@ class AicodeInstaller:
         print("✓ pip is installed")
         return True
     
+    def check_dependencies(self, verbose=True):
+        """Return the requirement specs that are not installed at a compatible version"""
+        if importlib_metadata is None:
+            return list(DEPENDENCIES)
+        missing = []
+        for spec in DEPENDENCIES:
+            name, minimum = parse_requirement(spec)
+            try:
+                installed = importlib_metadata.version(name)
+            except importlib_metadata.PackageNotFoundError:
+                installed = None
+            if installed is None:
+                status = "not installed"
+            elif minimum and version_tuple(installed) < version_tuple(minimum):
+                status = f"{installed} installed, need >={minimum}"
+            else:
+                if verbose:
+                    print(f"  ✓ {name} {installed}")
+                continue
+            missing.append(spec)
+            if verbose:
+                print(f"  ✗ {name} ({status})")
+        return missing
+    
     def install_dependencies(self):
-        """Install required Python packages"""
+        """Install required Python packages that are missing or outdated"""
         self.print_step(3, "Installing dependencies...")
         
-        dependencies = [
-            "groq",
-            "rich",
-            "python-dotenv"
-        ]
+        missing = self.check_dependencies()
+        if not missing:
+            print("✓ All dependencies already satisfied")
+            return True
         
         print("Installing packages:")
-        for dep in dependencies:
+        for dep in missing:
             print(f"  - {dep}...")
         
-        deps_str = " ".join(dependencies)
+        # argv list, no shell: cmd.exe would treat ">=" in a spec as a redirect
+        cmd = [sys.executable, "-m", "pip", "install", *missing]
+        if self.wheelhouse:
+            # Offline: resolve only from the local wheel directory
+            print(f"\n📦 Using wheelhouse {self.wheelhouse} (no index)")
+            cmd += ["--no-index", "--find-links", self.wheelhouse]
+        elif self.is_termux:
+            print("\n📱 Termux detected - reusing the pip cache between installs")
         
-        if self.is_termux:
-            # Termux-specific installation
-            print("\n📱 Termux detected - using optimized installation...")
-            success, output = self.run_command(
-                f"{self.python_cmd} -m pip install {deps_str} --no-cache-dir",
-                check=False
-            )
-        else:
-            # Standard installation
-            success, output = self.run_command(
-                f"{self.python_cmd} -m pip install {deps_str}",
-                check=False
-            )
+        try:
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        except OSError as e:
+            print(f"❌ Could not run pip: {e}")
+            return False
         
-        if not success:
-            print(f"❌ Installation failed:\n{output}")
+        if result.returncode != 0:
+            print(f"❌ Installation failed:\n{result.stderr or result.stdout}")
+            return False
+        
+        still_missing = self.check_dependencies(verbose=False)
+        if still_missing:
+            print(f"❌ Still unsatisfied after install: {', '.join(still_missing)}")
             return False
         
         print("✓ All dependencies installed successfully")
         return True
     
+    def check_only(self):
+        """Report dependency status without installing anything"""
+        print("Checking dependencies:")
+        if importlib_metadata is None:
+            print("❌ importlib.metadata is unavailable; cannot check installed versions")
+            return False
+        missing = self.check_dependencies()
+        if missing:
+            print(f"\n❌ Missing or outdated: {', '.join(missing)}")
+            return False
+        print("\n✓ All dependencies satisfied")
+        return True
+    
     def create_aicode_script(self):
         """Create the main aicode_pro.py script"""
         self.print_step(4, "Creating Aicode Pro script...")
@@ -440,10 +514,20 @@ Happy coding! 🚀
 
 def main():
     """Entry point"""
-    installer = AicodeInstaller()
+    parser = argparse.ArgumentParser(description="Aicode Pro installer")
+    parser.add_argument("--wheelhouse", metavar="DIR",
+                        help="Install from a local directory of wheels without contacting an index")
+    parser.add_argument("--check-only", action="store_true",
+                        help="Only report whether dependencies are satisfied (exit 1 if not)")
+    args = parser.parse_args()
+    
+    if args.wheelhouse and not Path(args.wheelhouse).is_dir():
+        print(f"❌ Wheelhouse not found: {args.wheelhouse}")
+        sys.exit(1)
+    installer = AicodeInstaller(wheelhouse=args.wheelhouse)
     
     try:
-        success = installer.install()
+        success = installer.check_only() if args.check_only else installer.install()
         sys.exit(0 if success else 1)
     except KeyboardInterrupt:
         print("\n\n❌ Installation cancelled by user")
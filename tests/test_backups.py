@@ -0,0 +1,39 @@
+import time
+
+from rich.console import Console
+
+from aiCode import Config, _FM
+
+
+def _fm(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(time, "strftime", lambda f, *a: "20260101_000000")
+    return _FM(Console(quiet=True), Config())
+
+
+def test_same_named_files_all_backed_up(tmp_path, monkeypatch):
+    fm = _fm(tmp_path, monkeypatch)
+    for i in range(102):
+        (tmp_path / "d" / str(i)).mkdir(parents=True)
+        (tmp_path / "d" / str(i) / "__init__.py").write_text(f"x = {i}\n")
+    assert all(fm._cb(f"d/{i}/__init__.py", True) for i in range(102))
+    bs = sorted(fm._bd.iterdir())
+    assert len(bs) == 102
+    assert {b.read_text() for b in bs} == {f"x = {i}\n" for i in range(102)}
+
+
+def test_repeat_backups_get_counters(tmp_path, monkeypatch):
+    fm = _fm(tmp_path, monkeypatch)
+    (tmp_path / "a.py").write_bytes(b"a\r\n")
+    for _ in range(3):
+        assert fm._cb("a.py", True)
+    assert len(list(fm._bd.iterdir())) == 3
+    assert {b.read_bytes() for b in fm._bd.iterdir()} == {b"a\r\n"}
+
+
+def test_failed_backup_returns_false(tmp_path, monkeypatch):
+    fm = _fm(tmp_path, monkeypatch)
+    (tmp_path / "a.py").write_text("a\n")
+    fm._bd = tmp_path / "a.py"
+    assert fm._cb("a.py", True) is False
+    assert fm._cb("missing.py", True) is True
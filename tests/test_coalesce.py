@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+
+from aiCode import _SF
+
+
+def _run(sf, k, fn, n):
+    out, th = [None] * n, []
+
+    def go(i):
+        try:
+            out[i] = sf.do(k, fn)
+        except BaseException as ex:
+            out[i] = ex
+    for i in range(n):
+        th.append(threading.Thread(target=go, args=(i,)))
+        th[-1].start()
+    return out, th
+
+
+def _leader(sf, k, r=None, ex=None):
+    go, st = threading.Event(), threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        st.set()
+        go.wait(5)
+        if ex:
+            raise ex
+        return r
+    out, th = _run(sf, k, fn, 1)
+    assert st.wait(5)
+    return go, calls, out, th
+
+
+def _wait(sf, k, n):
+    while len(sf._p[k]._condition._waiters) < n:
+        pass
+
+
+def _join(th):
+    for t in th:
+        t.join(5)
+
+
+def test_followers_share_one_call():
+    sf = _SF()
+    go, calls, lo, lt = _leader(sf, "k", r="R")
+    fo, ft = _run(sf, "k", lambda: pytest.fail("second call"), 4)
+    _wait(sf, "k", 4)
+    go.set()
+    _join(lt + ft)
+    assert calls == [1]
+    assert lo == [("R", False)]
+    assert fo == [("R", True)] * 4
+    assert sf._p == {}
+
+
+def test_leader_exception_reaches_followers():
+    sf = _SF()
+    go, _, lo, lt = _leader(sf, "k", ex=ValueError("boom"))
+    fo, ft = _run(sf, "k", lambda: pytest.fail("second call"), 2)
+    _wait(sf, "k", 2)
+    go.set()
+    _join(lt + ft)
+    assert isinstance(lo[0], ValueError)
+    assert all(isinstance(x, ValueError) and str(x) == "boom" for x in fo)
+    assert sf._p == {}
+    assert sf.do("k", lambda: "again") == ("again", False)
+
+
+def test_leader_interrupt_fails_followers():
+    sf = _SF()
+    go, _, lo, lt = _leader(sf, "k", ex=KeyboardInterrupt())
+    fo, ft = _run(sf, "k", lambda: pytest.fail("second call"), 1)
+    _wait(sf, "k", 1)
+    go.set()
+    _join(lt + ft)
+    assert isinstance(lo[0], KeyboardInterrupt)
+    assert isinstance(fo[0], RuntimeError)
+    assert sf._p == {}
+
+
+def test_sequential_calls_do_not_share():
+    sf = _SF()
+    assert sf.do("k", lambda: 1) == (1, False)
+    assert sf.do("k", lambda: 2) == (2, False)
+
+
+def test_key_normalises_whitespace_only():
+    a = [{"role": "user", "content": "x  \r\ny\n"}]
+    b = [{"role": "user", "content": "x\ny"}]
+    kw = {"temperature": 0.7}
+    assert _SF.key("groq", "m", a, kw) == _SF.key("groq", "m", b, kw)
+    assert _SF.key("groq", "m", a, kw) != _SF.key("local", "m", a, kw)
+    assert _SF.key("groq", "m", a, kw) != _SF.key("groq", "m", a, {"temperature": 0.2})
+    assert _SF.key("groq", "m", a, kw) != _SF.key("groq", "m", [{"role": "user", "content": "x y"}], kw)
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from aiCode import _cmx, _jcm, _rnm
+
+
+def test_jcm_accepts_rules_and_renames():
+    d, er = _jcm(json.dumps({"rules": [{"find": r"foo\((\w+)\)", "replace": r"bar(\1)"}],
+                             "renames": {"old": "new"}}))
+    assert er == "" and d["renames"] == {"old": "new"}
+
+
+@pytest.mark.parametrize("sp, msg", [
+    ("x", "not valid JSON"),
+    ([], "top level"),
+    ({"rules": {}}, "top level"),
+    ({}, "at least one"),
+    ({"rules": [{"find": "a"}]}, '"find" and "replace"'),
+    ({"rules": [{"find": "(", "replace": ""}]}, "valid Python regex"),
+    ({"rules": [{"find": "a", "replace": r"\2"}]}, "valid replacement"),
+    ({"renames": {"a-b": "c"}}, "identifiers"),
+    ({"renames": {"a": 1}}, "identifiers"),
+])
+def test_jcm_rejects(sp, msg):
+    d, er = _jcm(sp if isinstance(sp, str) else json.dumps(sp))
+    assert d is None and msg in er
+
+
+def test_rename_python_skips_strings_and_comments():
+    ct = 'old = 1\nprint(old, "old")  # old\nx.old_y = old_z\n'
+    assert _rnm("a.py", ct, {"old": "new"}) == 'new = 1\nprint(new, "old")  # old\nx.old_y = old_z\n'
+
+
+def test_rename_other_files_uses_word_boundaries():
+    assert _rnm("a.js", "old(old_x, x.old);", {"old": "nu"}) == "nu(old_x, x.nu);"
+
+
+def test_rename_untokenizable_python_falls_back():
+    assert _rnm("a.py", 'old("\n', {"old": "new"}) == 'new("\n'
+
+
+def test_cmx_keeps_crlf(tmp_path):
+    p = tmp_path / "a.py"
+    p.write_bytes(b"a = 1\r\nb = a\r\n")
+    fp, new, sha, ad, rm = _cmx(str(p), [(r"^b", "c")], {"a": "z"})
+    assert new == "z = 1\r\nc = z\r\n"
+    assert (ad, rm) == (2, 2) and sha
+
+
+def test_cmx_unchanged_and_unreadable(tmp_path):
+    p = tmp_path / "a.py"
+    p.write_text("x = 1\n")
+    assert _cmx(str(p), [("nomatch", "y")], {})[1] is None
+    (tmp_path / "b.py").write_bytes(b"\xff\xfe")
+    assert _cmx(str(tmp_path / "b.py"), [("x", "y")], {})[1] is None
@@ -0,0 +1,81 @@
+import ast
+
+from aiCode import _CM
+
+SRC = '''"""Module doc."""
+import os
+import os
+
+
+def target(x):
+    """Target doc."""
+    return helper(x) + 1
+
+
+def helper(x):
+    """Helper doc."""
+    a = x
+    b = a + 1
+    c = b + 1
+    # note
+    return c
+
+
+class K:
+    """K doc."""
+
+    def m(self):
+        y = 1
+        y += 1
+        y += 1
+        y += 1
+        return y
+'''
+
+
+def test_elide_round_trip():
+    r, mp = _CM.run("f.py", SRC, "fix target", tv=False)
+    assert mp and "__aicode_" in r
+    assert "def target(x):\n    \"\"\"Target doc.\"\"\"\n    return helper(x) + 1" in r
+    assert _CM.restore(r, mp) == SRC
+    ed = r.replace("return helper(x) + 1", "return helper(x) + 2")
+    assert _CM.restore(ed, mp) == SRC.replace("return helper(x) + 1", "return helper(x) + 2")
+
+
+def test_restore_needs_every_marker():
+    r, mp = _CM.run("f.py", SRC, "fix target", tv=False)
+    k = next(iter(mp))
+    assert _CM.restore(r.replace(f"__aicode_{k}__", ""), mp) is None
+    assert _CM.restore("anything", {}) == "anything"
+
+
+def test_no_relevant_def_keeps_bodies():
+    r, mp = _CM.run("f.py", SRC, "unrelated words", tv=False)
+    assert r == SRC and mp == {}
+
+
+def test_trivia_stripped_and_still_parses():
+    r, mp = _CM.run("f.py", SRC, "fix target")
+    assert mp == {}
+    ast.parse(r)
+    assert "# note" not in r and "Helper doc" not in r and "Module doc" not in r
+    assert r.count("import os") == 1
+
+
+def test_inline_docstring_keeps_header():
+    src = 'def f(): "doc"; return 1\n\n\nclass C:\n    "doc"\n    x = 1\n'
+    r, _ = _CM.run("f.py", src, "")
+    assert "def f():" in r and "class C:" in r
+    ast.parse(r)
+
+
+def test_block_comment_strip_stays_on_comment_lines():
+    src = "/* head */\nint a; /* x */\nint b;\n/* y */ int c;\n  /*\n   * doc\n   */\n// line\nint d;\n"
+    r, mp = _CM.run("f.c", src)
+    assert mp == {}
+    assert r.splitlines() == ["int a; /* x */", "int b;", "/* y */ int c;", "int d;"]
+
+
+def test_non_python_without_trivia_is_untouched():
+    assert _CM.run("f.c", "a\n\n// b\n", tv=False) == ("a\n\n// b\n", {})
+    assert _CM.run("f.py", "def (:\n", "", tv=False) == ("def (:\n", {})
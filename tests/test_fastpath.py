@@ -0,0 +1,48 @@
+import pytest
+
+from aiCode import _LX
+
+
+@pytest.mark.parametrize("ui, fp, k", [
+    ("please format this file", "a.py", "_fmt"),
+    ("run black", "a.py", "_fmt"),
+    ("sort imports", "a.py", "_srt"),
+    ("can you organize the imports in util.py", "util.py", "_srt"),
+    ("remove trailing whitespace", "a.py", "_tws"),
+    ("strip trailing spaces", "a.py", "_tws"),
+    ("how many lines are there", "a.py", "_cnt"),
+    ("format the output as json", "geo.py", None),
+    ("sort imports and add a docstring", "a.py", None),
+    ("count lines of code per function", "a.py", None),
+])
+def test_match(ui, fp, k):
+    assert _LX.match(ui, fp) == k
+
+
+def test_tws_keeps_line_endings():
+    assert _LX._tws("f", "a \r\nb\t\nc  ")[0] == "a\r\nb\nc"
+    assert _LX._tws("f", "a\r\n")[0] == "a\r\n"
+    ct = "a\nb\n"
+    r, msg = _LX._tws("f", ct)
+    assert r is ct and "0 lines" in msg
+
+
+def test_srt_stdlib_fallback(monkeypatch):
+    monkeypatch.setattr(_LX, "_tool", staticmethod(lambda cs, fp, ct: (None, "")))
+    ct = "import sys\nfrom b import c\nimport os\nimport sys\n\nx = 1\nimport z\nimport a\n"
+    r, msg = _LX._srt("a.py", ct)
+    assert r == "import os\nimport sys\nfrom b import c\n\nx = 1\nimport a\nimport z\n"
+    assert msg == "sorted imports"
+    assert _LX._srt("a.js", ct) is None
+    assert _LX._srt("a.py", "def (:\n") is None
+
+
+def test_cnt():
+    r, msg = _LX._cnt("f.py", "# c\n\nx = 1\n")
+    assert r is None and "3 lines (1 code, 1 blank, 1 comment)" in msg
+
+
+def test_run_skips_unmatched():
+    assert _LX.run("explain this", "a.py", "x") is None
+    r, msg = _LX.run("trim trailing spaces", "a.py", "x \n")
+    assert r == "x\n" and "no model call" in msg
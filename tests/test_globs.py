@@ -0,0 +1,54 @@
+import re
+
+from aiCode import _GI, _gre
+
+
+def m(g, p):
+    return re.match(_gre(g), p) is not None
+
+
+def test_star_stays_in_segment():
+    assert m("*.py", "a.py")
+    assert not m("*.py", "d/a.py")
+    assert not m("*.py", "a.pyc")
+
+
+def test_double_star():
+    assert m("**/*.py", "a.py")
+    assert m("**/*.py", "x/y/a.py")
+    assert m("src/**", "src/x/y")
+    assert not m("src/**/t.py", "lib/t.py")
+
+
+def test_question_and_classes():
+    assert m("a?.txt", "ab.txt")
+    assert not m("a?.txt", "a/.txt")
+    assert m("[ab].c", "b.c")
+    assert not m("[!ab].c", "a.c")
+    assert m("[!ab].c", "z.c")
+
+
+def test_literal_chars_escaped():
+    assert m("a+b.(x)", "a+b.(x)")
+    assert not m("a.b", "axb")
+
+
+def test_gitignore_rules(tmp_path):
+    (tmp_path / ".gitignore").write_text("# c\n*.log\n!keep.log\nbuild/\n/top.txt\ndocs/*.md\n")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / ".gitignore").write_text("secret\n")
+    gi = _GI()
+    gi.add("", tmp_path / ".gitignore")
+    gi.add("sub", tmp_path / "sub" / ".gitignore")
+    gi.add("", tmp_path / "missing")
+    assert gi.hit("x/y.log", False)
+    assert not gi.hit("x/keep.log", False)
+    assert gi.hit("a/build", True)
+    assert not gi.hit("a/build", False)
+    assert gi.hit("top.txt", False)
+    assert not gi.hit("a/top.txt", False)
+    assert gi.hit("docs/r.md", False)
+    assert not gi.hit("docs/x/r.md", False)
+    assert gi.hit("sub/secret", False)
+    assert gi.hit("sub/d/secret", False)
+    assert not gi.hit("secret", False)
@@ -0,0 +1,40 @@
+import json
+
+from aiCode import _JB, _PT
+
+
+def _pr(cx, d="make a thing"):
+    return _PT.build("create", cx, fn="a.py", d=d)
+
+
+def test_resume_round_trip(tmp_path):
+    jb = _JB.new(tmp_path, "j", "jobs.txt", ["create a.py x", "modify b.py y"])
+    jb.cu = 0
+    h = jb.key(_pr("File context (z.py):\nz"), "create")
+    jb.put(h, "RESULT")
+    jb.done(0, True)
+    with open(jb.p, "a", encoding="utf-8") as f:
+        f.write('{"i": 1, "ok"')
+    rj = _JB.open(tmp_path, "j")
+    assert rj.us == ["create a.py x", "modify b.py y"]
+    assert rj.rs == {h: "RESULT"}
+    assert rj.todo() == [1]
+
+
+def test_key_ignores_loaded_context(tmp_path):
+    jb = _JB(tmp_path / "j.jsonl")
+    jb.us, jb.cu = ["create a.py x", "create b.py y"], 0
+    a = jb.key(_pr("File context (a.py):\nA"), "create")
+    assert a == jb.key(_pr("File context (b.py):\nB"), "create")
+    assert a == jb.key(_pr(None), "create")
+    assert a != jb.key(_pr(None, "other"), "create")
+    assert a != jb.key(_pr(None), "modify")
+    jb.cu = 1
+    assert a != jb.key(_pr(None), "create")
+
+
+def test_new_writes_header(tmp_path):
+    assert _JB.open(tmp_path, "nope") is None
+    jb = _JB.new(tmp_path, "k", "s", ["u"])
+    hd = json.loads(jb.p.read_text().splitlines()[0])
+    assert (hd["job"], hd["src"], hd["units"]) == ("k", "s", ["u"])
@@ -0,0 +1,31 @@
+from aiCode import _m3
+
+B = "a\nb\nc\nd\ne\n"
+
+
+def test_disjoint_edits_merge():
+    x = B.replace("b\n", "B\n")
+    y = B.replace("e\n", "E\nf\n")
+    assert _m3(B, x, y) == "a\nB\nc\nd\nE\nf\n"
+    assert _m3(B, y, x) == _m3(B, x, y)
+
+
+def test_one_side_unchanged():
+    x = B.replace("c\n", "")
+    assert _m3(B, x, B) == x
+    assert _m3(B, B, x) == x
+    assert _m3(B, B, B) == B
+
+
+def test_identical_edits_dedupe():
+    x = B.replace("c\n", "C\n")
+    assert _m3(B, x, x) == x
+
+
+def test_overlapping_edits_conflict():
+    assert _m3(B, B.replace("c\n", "X\n"), B.replace("c\n", "Y\n")) is None
+    assert _m3(B, B.replace("b\nc\n", "Z\n"), B.replace("c\nd\n", "W\n")) is None
+
+
+def test_inserts_at_same_point_conflict():
+    assert _m3(B, B.replace("c\n", "c\nx\n"), B.replace("c\n", "c\ny\n")) is None
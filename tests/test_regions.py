@@ -0,0 +1,74 @@
+from aiCode import _TG
+
+SRC = '''import os
+from x import y
+
+
+class K:
+    @staticmethod
+    def m(x):
+        return x
+
+    def n(self):
+        return 1
+
+
+@dec
+def top(a):
+    return a
+'''
+
+
+def test_find_line_range():
+    assert _TG.find(SRC, "2-3", "a.txt") == (1, 3, "")
+    assert _TG.find(SRC, "5", "a.py") == (4, 5, "")
+    assert _TG.find(SRC, "0-2", "a.py") is None
+    assert _TG.find(SRC, "3-99", "a.py") is None
+
+
+def test_find_method_context():
+    s, e, cx = _TG.find(SRC, "K.n", "a.py")
+    assert (s, e) == (9, 11)
+    assert cx == "class K:\n    @staticmethod\n    def m(x): ...\n    def n(self): ...  # <- target"
+
+
+def test_find_top_level_includes_decorators_and_imports():
+    s, e, cx = _TG.find(SRC, "top", "a.py")
+    assert SRC.splitlines()[s] == "@dec"
+    assert cx.splitlines() == ["import os", "from x import y", "class K: ...", "@dec", "def top(a): ...  # <- target"]
+
+
+def test_find_misses():
+    assert _TG.find(SRC, "nope", "a.py") is None
+    assert _TG.find(SRC, "K", "a.js") is None
+    assert _TG.find("def (:\n", "f", "a.py") is None
+
+
+def _big(body):
+    return body + "\n" * 60
+
+
+def test_guess_single_local_target():
+    src = _big(SRC)
+    assert _TG.guess(src, "make top return a + 1", "a.py") == "top"
+    assert _TG.guess(src, "fix K.n", "a.py") == "K.n"
+    assert _TG.guess(src, "speed up n", "a.py") == "K.n"
+
+
+def test_guess_declines():
+    src = _big(SRC)
+    assert _TG.guess(SRC, "make top return a + 1", "a.py") is None
+    assert _TG.guess(src, "make top call m", "a.py") is None
+    assert _TG.guess(src, "rename top to go", "a.py") is None
+    assert _TG.guess(src, "update all callers of top", "a.py") is None
+    assert _TG.guess(src, "add logging to top throughout the file", "a.py") is None
+    assert _TG.guess(src, "make it faster", "a.py") is None
+    assert _TG.guess(src, "fix top", "a.js") is None
+
+
+def test_splice_reindents_region():
+    s, e, _ = _TG.find(SRC, "K.n", "a.py")
+    assert _TG.region(SRC, s, e) == "def n(self):\n    return 1\n"
+    out = _TG.splice(SRC, s, e, "def n(self):\n    return 2\n")
+    assert out == SRC.replace("return 1", "return 2")
+    assert _TG.splice("a\nb\n", 2, 2, "c") == "a\nb\nc\n"
@@ -0,0 +1,70 @@
+import pytest
+
+from aiCode import _BE, _CW, _PB, _RB, _RS, _SR
+
+
+class _FB(_BE):
+    n = "fake"
+
+    def chat(self, ms, m, **kw):
+        return _RS("R:" + ms[-1]["content"], m, self.n, 3, 2, lat=0.01)
+
+    def stream(self, ms, m, **kw):
+        def g():
+            for d in ("S:", ms[-1]["content"]):
+                yield d, None
+            yield None, (4, 2)
+        return _SR(self, g(), m, {})
+
+
+def _ms(t):
+    return [{"role": "user", "content": t}]
+
+
+def _rec(tmp_path, rqs, st=False):
+    p = str(tmp_path / "c.jsonl.gz")
+    w = _CW(p)
+    rb = _RB(_FB(), w)
+    for t in rqs:
+        if st:
+            "".join(rb.stream(_ms(t), "m"))
+        else:
+            rb.chat(_ms(t), "m", temperature=0.1)
+    w.close()
+    return _PB("fake", _PB.load(p), 0)
+
+
+def test_replay_serves_matching_responses(tmp_path):
+    pb = _rec(tmp_path, ["A", "B", "A"])
+    assert pb.chat(_ms("B"), "m", temperature=0.1).t == "R:B"
+    rs = pb.chat(_ms("A"), "m", temperature=0.1)
+    assert (rs.t, rs.pt, rs.ct) == ("R:A", 3, 2)
+    assert pb.chat(_ms("A"), "m", temperature=0.1).t == "R:A"
+    with pytest.raises(RuntimeError, match="not in cassette"):
+        pb.chat(_ms("A"), "m", temperature=0.1)
+
+
+def test_replay_miss_does_not_substitute(tmp_path):
+    pb = _rec(tmp_path, ["A", "B"])
+    with pytest.raises(RuntimeError):
+        pb.chat(_ms("Z"), "m", temperature=0.1)
+    with pytest.raises(RuntimeError):
+        pb.chat(_ms("A"), "m", temperature=0.9)
+    with pytest.raises(RuntimeError):
+        pb.chat(_ms("A"), "other", temperature=0.1)
+    assert pb.chat(_ms("A"), "m", temperature=0.1).t == "R:A"
+    assert pb.chat(_ms("B"), "m", temperature=0.1).t == "R:B"
+
+
+def test_replay_stream_chunks(tmp_path):
+    pb = _rec(tmp_path, ["A"], st=True)
+    sr = pb.stream(_ms("A"), "m")
+    assert "".join(sr) == "S:A"
+    assert (sr.rs.pt, sr.rs.ct) == (4, 2)
+
+
+def test_recording_appends(tmp_path):
+    _rec(tmp_path, ["A"])
+    pb = _rec(tmp_path, ["B"])
+    assert pb.chat(_ms("A"), "m", temperature=0.1).t == "R:A"
+    assert pb.chat(_ms("B"), "m", temperature=0.1).t == "R:B"
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from aiCode import _apd, _jed
+
+
+def j(*fs, **kw):
+    return json.dumps({"files": list(fs), **kw})
+
+
+def test_jed_accepts_valid_edits():
+    d, er = _jed(j({"path": "a.py", "action": "create", "content": "x\n"},
+                   {"path": "b.py", "action": "modify", "patch": "@@ -1 +1 @@\n-a\n+b\n"},
+                   {"path": "c.py", "action": "delete"}, notes="n"))
+    assert er == "" and len(d["files"]) == 3
+
+
+@pytest.mark.parametrize("t, msg", [
+    ("{", "not valid JSON"),
+    ("[]", '"files" list'),
+    (j(notes=1), '"notes"'),
+    (j({"path": " ", "action": "create", "content": ""}), "path"),
+    (j({"path": "a", "action": "rename"}), "action"),
+    (j({"path": "a", "action": "modify"}), "exactly one"),
+    (j({"path": "a", "action": "modify", "content": "", "patch": ""}), "exactly one"),
+    (j({"path": "a", "action": "create", "patch": "@@ -1 +1 @@"}), "not a patch"),
+])
+def test_jed_rejects(t, msg):
+    d, er = _jed(t)
+    assert d is None and msg in er
+
+
+def test_apd_applies_hunks():
+    src = "a\nb\nc\nd\ne\nf\n"
+    pt = "@@ -1,3 +1,3 @@\n a\n-b\n+B\n c\n@@ -5,2 +5,3 @@\n e\n f\n+g\n"
+    assert _apd(src, pt) == "a\nB\nc\nd\ne\nf\ng\n"
+
+
+def test_apd_finds_moved_context():
+    src = "x\ny\na\nb\nc\n"
+    assert _apd(src, "@@ -1,3 +1,3 @@\n a\n-b\n+B\n c\n") == "x\ny\na\nB\nc\n"
+
+
+def test_apd_insert_only_hunk():
+    assert _apd("a\nb\n", "@@ -1,0 +2,1 @@\n+z\n") == "a\nz\nb\n"
+
+
+def test_apd_ignores_trailing_whitespace_in_context():
+    assert _apd("a  \nb\n", "@@ -1,2 +1,2 @@\n a\n-b\n+c\n") .splitlines()[1] == "c"
+
+
+def test_apd_rejects_bad_patches():
+    assert _apd("a\nb\n", "no hunks here") is None
+    assert _apd("a\nb\n", "@@ -1,2 +1,2 @@\n a\n-q\n+c\n") is None
+
+
+def test_apd_uses_stated_line_for_repeated_context():
+    src = "def a(x):\n    return x\n\n\ndef b(x):\n    return x\n"
+    pt = "@@ -6,1 +6,1 @@\n-    return x\n+    return x + 1\n"
+    assert _apd(src, pt) == "def a(x):\n    return x\n\n\ndef b(x):\n    return x + 1\n"
+    pt = "@@ -1,1 +1,1 @@\n-    return x\n+    return x + 1\n"
+    assert _apd(src, pt) is None